@@ -1,11 +1,11 @@
-from flask import Flask, request, send_file, jsonify
+from flask import Flask, request, send_file, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 import converter
 import io
+import json
 import os
-import zipfile
 import requests
 import ai_service
 import cache_manager
@@ -30,7 +30,10 @@ CORS(app, resources={
         "origins": "*",
         "methods": ["GET", "POST", "OPTIONS"],
         "allow_headers": "*",
-        "expose_headers": ["Content-Disposition"]
+        "expose_headers": ["Content-Disposition", "ETag",
+                            "X-Images", "X-Images-Shared", "X-Images-Recompressed", "X-Image-Bytes-Saved",
+                            "X-Compression-Dpi", "X-Compression-Quality", "X-Predicted-Size", "X-Target-Met",
+                            "Server-Timing", "X-Stage-Bytes-Saved", "X-Linearized", "X-Incremental-Update"]
     }
 })
 
@@ -52,6 +55,155 @@ def health_check():
         }
     }), 200
 
+def not_modified(etag):
+    """304 response when the client already holds the result identified by etag"""
+    if etag and etag in request.if_none_match:
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+# Thumbnails are addressed by document hash, so a URL never changes content
+THUMBNAIL_CACHE_CONTROL = "public, max-age=86400, immutable"
+
+def parse_thumbnail_size(value):
+    """Thumbnail width in pixels from a request parameter (None keeps the 72 DPI default)"""
+    if not value:
+        return None
+    return min(max(int(value), converter.THUMBNAIL_MIN_SIZE), converter.THUMBNAIL_MAX_SIZE)
+
+def parse_sprite_params(params):
+    """(size, columns, rows, format) of a sprite sheet request, ValueError on bad input"""
+    try:
+        size = parse_thumbnail_size(params.get('size')) or converter.SPRITE_DEFAULT_SIZE
+        columns = int(params.get('columns', converter.SPRITE_COLUMNS))
+        rows = int(params.get('rows', converter.SPRITE_ROWS))
+    except ValueError:
+        raise ValueError("size, columns and rows must be whole numbers")
+    if not (1 <= columns <= 20 and 1 <= rows <= 20):
+        raise ValueError("columns and rows must be between 1 and 20")
+    # One RGB pixmap holds the whole sheet; keep it (at square cells) within the raster budget
+    if columns * rows * size * size * 3 > converter.RASTER_MEMORY_BUDGET:
+        raise ValueError("Sprite sheet too large: lower size, columns or rows")
+    fmt = params.get('format', 'jpg').lower()
+    if fmt not in converter.SPRITE_FORMATS:
+        raise ValueError(f"Unsupported sprite format: {fmt}. Use one of {', '.join(converter.SPRITE_FORMATS)}")
+    return size, columns, rows, fmt
+
+def sprite_url(doc_id, tile, size, columns, rows, fmt):
+    return f"/api/thumbnails/{doc_id}/sprites/{tile}?size={size}&columns={columns}&rows={rows}&format={fmt}"
+
+def thumbnail_url(doc_id, page_number, size=None):
+    url = f"/api/thumbnails/{doc_id}/{page_number}"
+    return f"{url}?size={size}" if size else url
+
+def cached_zip_chunks(etag, entries):
+    """
+    ZIP chunks of the result stored under etag in the result cache, or of entries
+    (produced lazily) while they are written to the cache for the next upload.
+    """
+    chunks = cache_manager.iter_result_stream(etag)
+    if chunks is not None:
+        print(f"DEBUG: Result cache hit for streamed {etag[:12]}")
+        return chunks
+    return cache_manager.store_result_stream(etag, converter.stream_zip(entries))
+
+def stream_zip_response(chunks, download_name, etag=None):
+    """
+    Send ZIP chunks as they are produced (chunked transfer).
+    The first chunk is produced up front so conversion errors still become a JSON 500.
+    """
+    chunks = iter(chunks)
+    first_chunk = next(chunks, b"")
+
+    def generate():
+        yield first_chunk
+        yield from chunks
+
+    response = Response(stream_with_context(generate()), mimetype='application/zip', direct_passthrough=True)
+    response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    if etag:
+        response.set_etag(etag)
+    return response
+
+def with_manifest(entries, stats):
+    """ZIP entries followed by a manifest.json of stats, which the entries fill as they are produced."""
+    yield from entries
+    yield "manifest.json", json.dumps(stats).encode()
+
+def parse_raster_options(params, fmt):
+    """
+    Rasterisation options of pdf-to-jpg/png requests: dpi, quality (JPG),
+    compression 0-9 (PNG), grayscale, transparent (PNG), passthrough (JPG) and pages.
+    Raises ValueError for malformed or out-of-range values.
+    """
+    def flag(name):
+        return params.get(name, 'false').lower() in ('true', '1', 'yes')
+
+    try:
+        options = {'dpi': int(params.get('dpi') or converter.RASTER_DEFAULT_DPI)}
+        if fmt == 'jpg' and params.get('quality'):
+            options['quality'] = int(params['quality'])
+        if fmt == 'png' and params.get('compression'):
+            options['compress_level'] = int(params['compression'])
+    except ValueError:
+        raise ValueError("dpi, quality and compression must be whole numbers")
+    if flag('grayscale'):
+        options['grayscale'] = True
+    if fmt == 'png' and flag('transparent'):
+        options['alpha'] = True
+    # Scanned pages go out as their embedded JPEG unless a specific rendering was asked for
+    if fmt == 'jpg' and params.get('passthrough', 'false' if params.get('dpi') else 'true').lower() in ('true', '1', 'yes'):
+        options['passthrough'] = True
+    converter.validate_raster_options(fmt, **options)
+    # Selections need the page count, they are checked when rendering
+    if params.get('pages'):
+        options['pages'] = params['pages']
+    return options
+
+def parse_target_bytes(params):
+    """target_bytes of compress-pdf requests: None when absent, ValueError unless a positive whole number."""
+    if not params.get('target_bytes'):
+        return None
+    try:
+        target_bytes = int(params['target_bytes'])
+    except ValueError:
+        raise ValueError("target_bytes must be a whole number")
+    if target_bytes <= 0:
+        raise ValueError("target_bytes must be positive")
+    return target_bytes
+
+def parse_compress_stages(params):
+    """stages of compress-pdf requests: comma-separated COMPRESS_STAGES or 'all', ValueError for unknown names."""
+    value = params.get('stages', '').strip().lower()
+    if value == 'all':
+        return converter.COMPRESS_STAGES
+    stages = tuple(sorted({stage.strip() for stage in value.split(',') if stage.strip()}))
+    unknown = [stage for stage in stages if stage not in converter.COMPRESS_STAGES]
+    if unknown:
+        raise ValueError(f"Unknown stages: {', '.join(unknown)} (use {', '.join(converter.COMPRESS_STAGES)} or all)")
+    return stages
+
+def parse_linearize(params):
+    """linearize flag of the PDF-producing endpoints (merge, compress, rotate)."""
+    return params.get('linearize', 'false').lower() in ('true', '1', 'yes')
+
+def set_linearized_header(response, pdf_stream):
+    """X-Linearized tells whether the returned PDF really is linearised (pikepdf may be missing)."""
+    response.headers['X-Linearized'] = 'true' if converter.is_linearized(pdf_stream.getbuffer()[:1024].tobytes()) else 'false'
+    return response
+
+def parse_incremental(params):
+    """incremental flag of metadata-only edits (rotate, edit-metadata), on by default."""
+    return params.get('incremental', 'true').lower() in ('true', '1', 'yes')
+
+def set_incremental_header(response, pdf_bytes, pdf_stream):
+    """X-Incremental-Update tells whether the result is the upload plus an appended update."""
+    updated = pdf_stream.getbuffer()
+    response.headers['X-Incremental-Update'] = 'true' if updated[:len(pdf_bytes)] == pdf_bytes else 'false'
+    updated.release()
+    return response
+
 def validate_file_size(file_bytes):
     """Validate file size is within limits"""
     size = len(file_bytes)
@@ -188,9 +340,16 @@ def convert_pdf_to_word():
                 "code": "FILE_TOO_LARGE"
             }), 413
         
+        mode = request.form.get('mode', converter.PDF_TO_WORD_DEFAULT_MODE)
+        if mode not in converter.PDF_TO_WORD_MODES:
+            return jsonify({
+                "error": f"Invalid mode. Use one of: {', '.join(converter.PDF_TO_WORD_MODES)}",
+                "code": "INVALID_MODE"
+            }), 400
+        
         # Convert PDF to Word
-        print("DEBUG: Calling converter.pdf_to_word...")
-        docx_stream = converter.pdf_to_word(pdf_bytes)
+        print(f"DEBUG: Calling converter.pdf_to_word (mode={mode})...")
+        docx_stream = converter.pdf_to_word(pdf_bytes, mode=mode)
         print("DEBUG: Converter returned. Verifying...")
         
         # Verify stream content with strict check
@@ -251,8 +410,13 @@ def convert_word_to_pdf():
                 "code": "FILE_TOO_LARGE"
             }), 413
         
+        etag = converter.word_to_pdf.cache_key(docx_bytes)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
         # Convert Word to PDF
-        pdf_stream = converter.word_to_pdf(docx_bytes)
+        pdf_stream = converter.word_to_pdf(docx_bytes, result_key=etag)
         
         # Verify stream content with strict check
         pdf_stream.seek(0, 2)
@@ -267,7 +431,8 @@ def convert_word_to_pdf():
             pdf_stream,
             as_attachment=True,
             download_name=f"{file.filename.rsplit('.', 1)[0]}.pdf",
-            mimetype='application/pdf'
+            mimetype='application/pdf',
+            etag=etag
         )
         
     except Exception as e:
@@ -296,9 +461,20 @@ def convert_split_pdf():
         pdf_bytes = file.read()
         validate_file_size(pdf_bytes)
         
-        result_stream, is_zip = converter.split_pdf(pdf_bytes, mode, data)
+        etag = converter.split_pdf.cache_key(pdf_bytes, mode, data)
+        cached = not_modified(etag)
+        if cached:
+            return cached
         
         output_filename = file.filename.rsplit('.', 1)[0]
+        
+        # Multi-file splits: stream the archive instead of building it in memory
+        if mode in converter.SPLIT_ZIP_MODES:
+            entries = converter.iter_split_parts(pdf_bytes, mode, data)
+            return stream_zip_response(cached_zip_chunks(etag, entries), f"{output_filename}_split.zip", etag)
+        
+        result_stream, is_zip = converter.split_pdf(pdf_bytes, mode, data, result_key=etag)
+        
         output_filename += '_split.zip' if is_zip else '_split.pdf'
         mimetype = 'application/zip' if is_zip else 'application/pdf'
         
@@ -306,9 +482,13 @@ def convert_split_pdf():
             result_stream,
             as_attachment=True,
             download_name=output_filename,
-            mimetype=mimetype
+            mimetype=mimetype,
+            etag=etag
         )
         
+    except ValueError as e:
+        # Bad N, bookmark level, page selection or a PDF without bookmarks
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         app.logger.error(f"Split PDF error: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -328,24 +508,63 @@ def convert_pdf_to_jpg():
         pdf_bytes = file.read()
         validate_file_size(pdf_bytes)
         
-        image_streams = converter.pdf_to_jpg(pdf_bytes)
+        try:
+            options = parse_raster_options(request.form, "jpg")
+        except ValueError as e:
+            return jsonify({"error": str(e), "code": "INVALID_OPTIONS"}), 400
+        
+        etag = converter.pdf_to_jpg.cache_key(pdf_bytes, **options)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        # Rendered page by page into the ZIP (and the result cache) unless a previous upload stored it
+        stats = {}
+        entries = converter.iter_pdf_page_images(pdf_bytes, "jpg", **options, stats=stats)
+        if options.get('passthrough'):
+            # Pages passed through without re-encoding are only known once they are all done
+            entries = with_manifest(entries, stats)
+        
+        response = stream_zip_response(
+            cached_zip_chunks(etag, entries),
+            f"{file.filename.rsplit('.', 1)[0]}_images.zip",
+            etag
+        )
+        return response
+    except ValueError as e:
+        return jsonify({"error": str(e), "code": "INVALID_PAGES"}), 400
+    except Exception as e:
+        app.logger.error(f"PDF to JPG error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/convert/extract-images', methods=['POST'])
+@limiter.limit("10 per minute")
+def convert_extract_images():
+    try:
+        if 'file' not in request.files:
+            return jsonify({"error": "No file provided"}), 400
+        
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({"error": "No file selected"}), 400
+        
+        try:
+            min_size = int(request.form.get('min_size') or 0)
+        except ValueError:
+            return jsonify({"error": "min_size must be a whole number", "code": "INVALID_OPTIONS"}), 400
         
-        # Create a ZIP file in memory
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for i, img_stream in enumerate(image_streams):
-                img_stream.seek(0)
-                zip_file.writestr(f"page_{i+1}.jpg", img_stream.read())
+        pdf_bytes = file.read()
+        validate_file_size(pdf_bytes)
         
-        zip_buffer.seek(0)
-        return send_file(
-            zip_buffer,
-            as_attachment=True,
-            download_name=f"{file.filename.rsplit('.', 1)[0]}_images.zip",
-            mimetype='application/zip'
+        entries = converter.iter_embedded_images(pdf_bytes, pages=request.form.get('pages'), min_size=min_size)
+        return stream_zip_response(
+            converter.stream_zip(entries),
+            f"{file.filename.rsplit('.', 1)[0]}_embedded_images.zip"
         )
+    except ValueError as e:
+        return jsonify({"error": str(e), "code": "NO_IMAGES"}), 400
     except Exception as e:
-        app.logger.error(f"PDF to JPG error: {str(e)}")
+        app.logger.error(f"Extract images error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/convert/jpg-to-pdf', methods=['POST'])
@@ -358,7 +577,7 @@ def convert_jpg_to_pdf():
         files = request.files.getlist('files')
         image_bytes_list = []
         for file in files:
-            if file.filename.lower().endswith(('.jpg', '.jpeg', '.png')):
+            if file.filename.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')):
                 img_bytes = file.read()
                 validate_file_size(img_bytes)
                 image_bytes_list.append(img_bytes)
@@ -391,22 +610,26 @@ def convert_pdf_to_png():
         pdf_bytes = file.read()
         validate_file_size(pdf_bytes)
         
-        image_streams = converter.pdf_to_png(pdf_bytes)
+        try:
+            options = parse_raster_options(request.form, "png")
+        except ValueError as e:
+            return jsonify({"error": str(e), "code": "INVALID_OPTIONS"}), 400
+        
+        etag = converter.pdf_to_png.cache_key(pdf_bytes, **options)
+        cached = not_modified(etag)
+        if cached:
+            return cached
         
-        # Create a ZIP file in memory
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for i, img_stream in enumerate(image_streams):
-                img_stream.seek(0)
-                zip_file.writestr(f"page_{i+1}.png", img_stream.read())
+        # Rendered page by page into the ZIP (and the result cache) unless a previous upload stored it
+        entries = converter.iter_pdf_page_images(pdf_bytes, "png", **options)
         
-        zip_buffer.seek(0)
-        return send_file(
-            zip_buffer,
-            as_attachment=True,
-            download_name=f"{file.filename.rsplit('.', 1)[0]}_png_images.zip",
-            mimetype='application/zip'
+        return stream_zip_response(
+            cached_zip_chunks(etag, entries),
+            f"{file.filename.rsplit('.', 1)[0]}_png_images.zip",
+            etag
         )
+    except ValueError as e:
+        return jsonify({"error": str(e), "code": "INVALID_PAGES"}), 400
     except Exception as e:
         app.logger.error(f"PDF to PNG error: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -425,22 +648,78 @@ def convert_rotate_pdf():
         
         file = request.files['file']
         angle = int(request.form.get('angle', 90))
+        linearize = parse_linearize(request.form)
+        incremental = parse_incremental(request.form)
         
         pdf_bytes = file.read()
         validate_file_size(pdf_bytes)
         
-        pdf_stream = converter.rotate_pdf(pdf_bytes, angle)
+        etag = converter.rotate_pdf.cache_key(pdf_bytes, angle, linearize=linearize, incremental=incremental)
+        cached = not_modified(etag)
+        if cached:
+            return cached
         
-        return send_file(
+        pdf_stream = converter.rotate_pdf(pdf_bytes, angle, linearize=linearize, incremental=incremental, result_key=etag)
+        
+        response = send_file(
             pdf_stream,
             as_attachment=True,
             download_name=f"{file.filename.rsplit('.', 1)[0]}_rotated.pdf",
-            mimetype='application/pdf'
+            mimetype='application/pdf',
+            etag=etag
         )
+        if linearize:
+            return set_linearized_header(response, pdf_stream)
+        return set_incremental_header(response, pdf_bytes, pdf_stream)
     except Exception as e:
         app.logger.error(f"Rotate PDF error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/convert/edit-metadata', methods=['POST'])
+@limiter.limit("10 per minute")
+def convert_edit_metadata():
+    """Set document info fields and/or page labels, appended as an incremental update."""
+    try:
+        if 'file' not in request.files:
+            return jsonify({"error": "No file provided"}), 400
+        
+        file = request.files['file']
+        metadata = {key: request.form[key] for key in converter.PDF_METADATA_KEYS if key in request.form}
+        page_labels = None
+        if request.form.get('page_labels'):
+            try:
+                page_labels = json.loads(request.form['page_labels'])
+            except ValueError:
+                return jsonify({"error": "page_labels must be JSON", "code": "INVALID_OPTIONS"}), 400
+        if not metadata and page_labels is None:
+            return jsonify({"error": "Nothing to change: give metadata fields or page_labels", "code": "INVALID_OPTIONS"}), 400
+        incremental = parse_incremental(request.form)
+        
+        pdf_bytes = file.read()
+        validate_file_size(pdf_bytes)
+        
+        try:
+            etag = converter.edit_pdf_metadata.cache_key(pdf_bytes, metadata, page_labels, incremental=incremental)
+            cached = not_modified(etag)
+            if cached:
+                return cached
+            pdf_stream = converter.edit_pdf_metadata(pdf_bytes, metadata, page_labels, incremental=incremental,
+                                                     result_key=etag)
+        except ValueError as e:
+            return jsonify({"error": str(e), "code": "INVALID_OPTIONS"}), 400
+        
+        response = send_file(
+            pdf_stream,
+            as_attachment=True,
+            download_name=file.filename,
+            mimetype='application/pdf',
+            etag=etag
+        )
+        return set_incremental_header(response, pdf_bytes, pdf_stream)
+    except Exception as e:
+        app.logger.error(f"Edit metadata error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/convert/ppt-to-pdf', methods=['POST'])
 @limiter.limit("10 per minute")
 def convert_ppt_to_pdf():
@@ -481,15 +760,17 @@ def convert_merge_pdf():
         if not pdf_bytes_list:
             return jsonify({"error": "No valid PDF files found"}), 400
             
-        pdf_stream = converter.merge_pdf(pdf_bytes_list)
+        linearize = parse_linearize(request.form)
+        pdf_stream = converter.merge_pdf(pdf_bytes_list, linearize=linearize)
         
         filename = "merged_document.pdf"
-        return send_file(
+        response = send_file(
             pdf_stream,
             mimetype='application/pdf',
             as_attachment=True,
             download_name=filename
         )
+        return set_linearized_header(response, pdf_stream) if linearize else response
     except Exception as e:
         app.logger.error(f"Merge PDF error: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -506,23 +787,84 @@ def convert_compress_pdf():
             return jsonify({"error": "No file selected"}), 400
 
         level = request.form.get('level', 'recommended')
+        try:
+            target_bytes = parse_target_bytes(request.form)
+            stages = parse_compress_stages(request.form)
+        except ValueError as e:
+            return jsonify({"error": str(e), "code": "INVALID_OPTIONS"}), 400
+        linearize = parse_linearize(request.form)
+        measure_stages = request.form.get('measure_stages', 'false').lower() in ('true', '1', 'yes')
         
         pdf_bytes = file.read()
         validate_file_size(pdf_bytes)
         
-        compressed_stream = converter.compress_pdf(pdf_bytes, level=level)
+        etag = converter.compress_pdf_report.cache_key(
+            pdf_bytes, level=level, target_bytes=target_bytes, stages=stages, linearize=linearize,
+            measure_stages=measure_stages)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        compressed_stream, stats = converter.compress_pdf_report(
+            pdf_bytes, level=level, target_bytes=target_bytes, stages=stages, linearize=linearize,
+            measure_stages=measure_stages, result_key=etag)
         
         filename = f"{file.filename.rsplit('.', 1)[0]}_compressed.pdf"
-        return send_file(
+        response = send_file(
             compressed_stream,
             mimetype='application/pdf',
             as_attachment=True,
-            download_name=filename
+            download_name=filename,
+            etag=etag
         )
+        response.headers['X-Images'] = str(stats['images'])
+        response.headers['X-Images-Shared'] = str(stats['shared_images'])
+        response.headers['X-Images-Recompressed'] = str(stats['recompressed'])
+        response.headers['X-Image-Bytes-Saved'] = str(stats['bytes_saved'])
+        if 'settings' in stats:
+            response.headers['X-Compression-Dpi'] = str(stats['settings']['dpi'])
+            response.headers['X-Compression-Quality'] = str(stats['settings']['quality'])
+        if target_bytes:
+            if 'predicted_size' in stats:
+                response.headers['X-Predicted-Size'] = str(stats['predicted_size'])
+            response.headers['X-Target-Met'] = 'true' if stats['target_met'] else 'false'
+        if stats['stages']:
+            response.headers['Server-Timing'] = ', '.join(
+                f"{stage['name']};dur={stage['seconds'] * 1000:.1f}" for stage in stats['stages'])
+            # Only the images stage, plus every stage with measure_stages, has bytes_saved
+            response.headers['X-Stage-Bytes-Saved'] = ', '.join(
+                f"{stage['name']}={stage['bytes_saved']}" for stage in stats['stages'] if 'bytes_saved' in stage)
+        return set_linearized_header(response, compressed_stream) if linearize else response
     except Exception as e:
         app.logger.error(f"Compress PDF error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/convert/compress-pdf/estimate', methods=['POST'])
+@limiter.limit("10 per minute")
+def estimate_compress_pdf():
+    """Dry run of compress-pdf: predicted output size per level (and for target_bytes), no file."""
+    try:
+        if 'file' not in request.files:
+            return jsonify({"error": "No file provided"}), 400
+            
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({"error": "No file selected"}), 400
+
+        try:
+            target_bytes = parse_target_bytes(request.form)
+        except ValueError as e:
+            return jsonify({"error": str(e), "code": "INVALID_OPTIONS"}), 400
+        
+        pdf_bytes = file.read()
+        validate_file_size(pdf_bytes)
+        
+        estimate = converter.estimate_compression(pdf_bytes, target_bytes=target_bytes)
+        return jsonify({"success": True, **estimate})
+    except Exception as e:
+        app.logger.error(f"Compress PDF estimate error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/convert/pdf-to-ppt', methods=['POST'])
 @limiter.limit("10 per minute")
 def convert_pdf_to_ppt():
@@ -570,14 +912,20 @@ def convert_add_page_numbers():
             'cover_page': request.form.get('isCoverPage', 'false')
         }
         
-        pdf_stream = converter.add_page_numbers(pdf_bytes, options)
+        etag = converter.add_page_numbers.cache_key(pdf_bytes, options)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        pdf_stream = converter.add_page_numbers(pdf_bytes, options, result_key=etag)
         
         filename = f"{file.filename.rsplit('.', 1)[0]}_numbered.pdf"
         return send_file(
             pdf_stream,
             mimetype='application/pdf',
             as_attachment=True,
-            download_name=filename
+            download_name=filename,
+            etag=etag
         )
     except Exception as e:
         app.logger.error(f"Add Page Numbers error: {str(e)}")
@@ -616,9 +964,14 @@ def convert_excel_to_pdf():
                 "code": "FILE_TOO_LARGE"
             }), 413
         
+        etag = converter.excel_to_pdf.cache_key(excel_bytes)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
         # Convert Excel to PDF
         print("DEBUG: Calling converter.excel_to_pdf...")
-        pdf_stream = converter.excel_to_pdf(excel_bytes)
+        pdf_stream = converter.excel_to_pdf(excel_bytes, result_key=etag)
         print("DEBUG: Converter returned. Verifying...")
         
         # Verify stream content
@@ -634,7 +987,8 @@ def convert_excel_to_pdf():
             pdf_stream,
             as_attachment=True,
             download_name=f"{file.filename.rsplit('.', 1)[0]}.pdf",
-            mimetype='application/pdf'
+            mimetype='application/pdf',
+            etag=etag
         )
         
     except Exception as e:
@@ -725,15 +1079,49 @@ def get_pdf_pages():
         if not file.filename.lower().endswith('.pdf'):
             return jsonify({"error": "Invalid file type. Please upload a PDF file."}), 400
         
+        try:
+            start = int(request.form.get('start', 1))
+            count = int(request.form['count']) if request.form.get('count') else None
+            size = parse_thumbnail_size(request.form.get('size'))
+            # inline: 'true' (every page base64, the old behaviour), 'false' (none) or N (first N pages)
+            inline = request.form.get('inline', 'true').lower()
+            inline_count = None if inline == 'true' else 0 if inline == 'false' else int(inline)
+        except ValueError:
+            return jsonify({"error": "start, count, size and inline must be whole numbers", "code": "INVALID_RANGE"}), 400
+        
         pdf_bytes = file.read()
         validate_file_size(pdf_bytes)
         
-        # Get page images
-        page_images = converter.get_pdf_page_images(pdf_bytes)
+        if request.form.get('sprites', 'false').lower() == 'true':
+            try:
+                size, columns, rows, fmt = parse_sprite_params(request.form)
+            except ValueError as e:
+                return jsonify({"error": str(e), "code": "INVALID_SPRITE"}), 400
+            doc_id, page_count, tile_count, pages = converter.get_thumbnail_sprite_index(
+                pdf_bytes, size=size, columns=columns, rows=rows
+            )
+            return jsonify({
+                "success": True,
+                "doc_id": doc_id,
+                "page_count": page_count,
+                "columns": columns,
+                "rows": rows,
+                "format": fmt,
+                "sprites": [sprite_url(doc_id, tile, size, columns, rows, fmt) for tile in range(tile_count)],
+                "pages": pages
+            }), 200
+        
+        # Get page images (inline base64 for the first screenful) and the page list for lazy thumbnail requests
+        doc_id, page_count, page_images = converter.get_pdf_page_images(
+            pdf_bytes, start=start, count=count, size=size, inline_count=inline_count
+        )
+        for page in page_images:
+            page['thumbnail_url'] = thumbnail_url(doc_id, page['page_number'], size)
         
         return jsonify({
             "success": True,
-            "page_count": len(page_images),
+            "doc_id": doc_id,
+            "page_count": page_count,
             "pages": page_images
         }), 200
         
@@ -741,6 +1129,67 @@ def get_pdf_pages():
         app.logger.error(f"Get PDF pages error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/thumbnails/<doc_id>/<int:page_number>', methods=['GET'])
+@limiter.limit("1000 per minute")
+def get_thumbnail(doc_id, page_number):
+    """Single page thumbnail as image/jpeg, for documents uploaded through get-pdf-pages"""
+    try:
+        try:
+            size = parse_thumbnail_size(request.args.get('size'))
+        except ValueError:
+            return jsonify({"error": "size must be a whole number", "code": "INVALID_SIZE"}), 400
+        
+        etag = f"{doc_id}-{page_number}-{size or 'native'}"
+        cached = not_modified(etag)
+        if cached:
+            cached.headers['Cache-Control'] = THUMBNAIL_CACHE_CONTROL
+            return cached
+        
+        try:
+            image_bytes = converter.get_page_thumbnail(doc_id, page_number, size)
+        except FileNotFoundError as e:
+            return jsonify({"error": str(e), "code": "DOCUMENT_EXPIRED"}), 404
+        except ValueError as e:
+            return jsonify({"error": str(e), "code": "INVALID_PAGE"}), 404
+        
+        response = send_file(io.BytesIO(image_bytes), mimetype='image/jpeg', etag=etag)
+        response.headers['Cache-Control'] = THUMBNAIL_CACHE_CONTROL
+        return response
+    except Exception as e:
+        app.logger.error(f"Thumbnail error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/thumbnails/<doc_id>/sprites/<int:tile>', methods=['GET'])
+@limiter.limit("1000 per minute")
+def get_thumbnail_sprite(doc_id, tile):
+    """Sprite sheet of columns x rows page thumbnails, laid out as in the get-pdf-pages sprite index"""
+    try:
+        try:
+            size, columns, rows, fmt = parse_sprite_params(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e), "code": "INVALID_SPRITE"}), 400
+        
+        etag = f"{doc_id}-sprite{columns}x{rows}-{tile}-{size}-{fmt}"
+        cached = not_modified(etag)
+        if cached:
+            cached.headers['Cache-Control'] = THUMBNAIL_CACHE_CONTROL
+            return cached
+        
+        try:
+            image_bytes = converter.get_thumbnail_sprite(doc_id, tile, size, columns, rows, fmt)
+        except FileNotFoundError as e:
+            return jsonify({"error": str(e), "code": "DOCUMENT_EXPIRED"}), 404
+        except ValueError as e:
+            return jsonify({"error": str(e), "code": "INVALID_TILE"}), 404
+        
+        mimetype = 'image/webp' if fmt == 'webp' else 'image/jpeg'
+        response = send_file(io.BytesIO(image_bytes), mimetype=mimetype, etag=etag)
+        response.headers['Cache-Control'] = THUMBNAIL_CACHE_CONTROL
+        return response
+    except Exception as e:
+        app.logger.error(f"Thumbnail sprite error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/convert/delete-pdf-pages', methods=['POST'])
 def delete_pdf_pages_endpoint():
     try:
@@ -756,26 +1205,31 @@ def delete_pdf_pages_endpoint():
         if not pages_to_delete_str:
             return jsonify({"error": "No pages specified for deletion"}), 400
         
-        try:
-            # Parse comma-separated page numbers
-            pages_to_delete = [int(p.strip()) for p in pages_to_delete_str.split(',') if p.strip()]
-        except ValueError:
-            return jsonify({"error": "Invalid page numbers format"}), 400
-        
         pdf_bytes = file.read()
         validate_file_size(pdf_bytes)
         
+        # Comma-separated page numbers or a selection such as '1-3,7,even'
+        pages_to_delete = pages_to_delete_str.strip()
+        
+        etag = converter.delete_pdf_pages.cache_key(pdf_bytes, pages_to_delete)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
         # Delete pages
-        pdf_stream = converter.delete_pdf_pages(pdf_bytes, pages_to_delete)
+        pdf_stream = converter.delete_pdf_pages(pdf_bytes, pages_to_delete, result_key=etag)
         
         filename = f"{file.filename.rsplit('.', 1)[0]}_deleted_pages.pdf"
         return send_file(
             pdf_stream,
             mimetype='application/pdf',
             as_attachment=True,
-            download_name=filename
+            download_name=filename,
+            etag=etag
         )
         
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
     except Exception as e:
         app.logger.error(f"Delete PDF pages error: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -811,6 +1265,53 @@ def convert_protect_pdf():
 
 
 
+@app.route('/api/pipeline', methods=['POST'])
+@limiter.limit("10 per minute")
+def run_pipeline():
+    """
+    Several page operations on one upload, opened and saved once:
+    operations is a JSON list such as [{"op": "rotate", "angle": 90},
+    {"op": "delete_pages", "pages": "2"}, {"op": "protect", "password": "..."}].
+    Per-step timings come back in Server-Timing.
+    """
+    try:
+        if 'file' not in request.files:
+            return jsonify({"error": "No file provided"}), 400
+        
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({"error": "No file selected"}), 400
+        
+        try:
+            operations = json.loads(request.form.get('operations', ''))
+        except ValueError:
+            return jsonify({"error": "operations must be JSON", "code": "INVALID_OPTIONS"}), 400
+        
+        pdf_bytes = file.read()
+        validate_file_size(pdf_bytes)
+        
+        try:
+            pdf_stream, timings = converter.run_pdf_pipeline(pdf_bytes, operations)
+        except ValueError as e:
+            return jsonify({"error": str(e), "code": "INVALID_OPTIONS"}), 400
+        
+        response = send_file(
+            pdf_stream,
+            as_attachment=True,
+            download_name=file.filename,
+            mimetype='application/pdf'
+        )
+        # timings are open, one per step, save; desc keeps repeated operations apart
+        metrics = []
+        for index, step in enumerate(timings):
+            desc = f"step {index}" if 0 < index < len(timings) - 1 else step['name']
+            metrics.append(f'{step["name"]};desc="{desc}";dur={step["seconds"] * 1000:.1f}')
+        response.headers['Server-Timing'] = ', '.join(metrics)
+        return response
+    except Exception as e:
+        app.logger.error(f"Pipeline error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/convert/unlock-pdf', methods=['POST'])
 def convert_unlock_pdf():
     try:
@@ -0,0 +1,282 @@
+import os
+import sys
+import time
+import fitz
+
+def create_benchmark_pdf(page_count=40):
+    """Build a text + table + image PDF that exercises the full pdf2docx pipeline."""
+    doc = fitz.open()
+    logo = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 64, 64), False)
+    logo.set_rect(logo.irect, (200, 60, 60))
+    logo_png = logo.tobytes("png")
+
+    for i in range(page_count):
+        page = doc.new_page()
+        page.insert_text((50, 50), f"Benchmark page {i + 1}", fontsize=18)
+        y = 90
+        for line in range(25):
+            page.insert_text((50, y), f"Line {line + 1}: The quick brown fox jumps over the lazy dog.", fontsize=10)
+            y += 14
+        # Simple 3x4 table grid
+        for row in range(5):
+            page.draw_line((50, 470 + row * 20), (450, 470 + row * 20))
+        for col in range(4):
+            page.draw_line((50 + col * 133, 470), (50 + col * 133, 550))
+        page.insert_image(fitz.Rect(460, 40, 540, 120), stream=logo_png)
+
+    pdf_bytes = doc.write()
+    doc.close()
+    return pdf_bytes
+
+def bench_pdf_to_word(page_count=40, max_workers=None):
+    """Wall-clock scaling of page-sharded pdf_to_word from 1 to N cores."""
+    from converter import pdf_to_word
+
+    max_workers = max_workers or os.cpu_count() or 1
+    pdf_bytes = create_benchmark_pdf(page_count)
+    print(f"pdf_to_word: {page_count} pages, {len(pdf_bytes)} bytes")
+
+    baseline = None
+    workers = 1
+    while True:
+        start = time.time()
+        docx_stream = pdf_to_word(pdf_bytes, workers=workers)
+        elapsed = time.time() - start
+        baseline = baseline or elapsed
+        print(f"  workers={workers:<3} {elapsed:7.2f}s  speedup x{baseline / elapsed:4.2f}  output {docx_stream.getbuffer().nbytes} bytes")
+        if workers >= max_workers:
+            break
+        workers = min(workers * 2, max_workers)
+
+def bench_thumbnail_sprites(page_counts=(100, 500, 2000), size=120):
+    """Per-page base64 JPEG thumbnails vs JPEG/WebP sprite sheets: encode time and bytes."""
+    import base64
+    import fitz
+    from converter import SPRITE_COLUMNS, SPRITE_ROWS, _thumbnail_matrix, _render_sprite_tile
+
+    for page_count in page_counts:
+        doc = fitz.open(stream=create_benchmark_pdf(page_count), filetype="pdf")
+        print(f"thumbnails: {page_count} pages at {size}px")
+
+        start = time.time()
+        payload = 0
+        for page in doc:
+            jpeg = page.get_pixmap(matrix=_thumbnail_matrix(page, size), colorspace=fitz.csRGB).tobytes("jpeg")
+            payload += len(base64.b64encode(jpeg))
+        print(f"  per-page base64 jpg  {time.time() - start:7.2f}s  {payload:>10} bytes  {page_count} images")
+
+        tiles = (page_count + SPRITE_COLUMNS * SPRITE_ROWS - 1) // (SPRITE_COLUMNS * SPRITE_ROWS)
+        for fmt in ("jpg", "webp"):
+            start = time.time()
+            payload = sum(len(_render_sprite_tile(doc, tile, size, SPRITE_COLUMNS, SPRITE_ROWS, fmt)) for tile in range(tiles))
+            print(f"  sprite {SPRITE_COLUMNS}x{SPRITE_ROWS} {fmt:<4}      {time.time() - start:7.2f}s  {payload:>10} bytes  {tiles} images")
+        doc.close()
+
+def create_codec_benchmark_images(width=2480, height=3508):
+    """One A4-at-300-DPI image per compress_pdf content class: photo, gray photo, text scan, flat diagram."""
+    import numpy as np
+    from PIL import Image, ImageDraw
+
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[0:height, 0:width]
+    photo = np.stack([xx * 255 / width, yy * 255 / height, (xx + yy) % 255], axis=2) + rng.normal(0, 20, (height, width, 3))
+    gray = np.clip(xx * 153 / width + yy * 102 / height + rng.normal(0, 15, (height, width)), 0, 255).astype(np.uint8)
+
+    scan = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(scan)
+    words = "the quick brown fox jumps over lazy dog scanned page of text with varying lines".split()
+    for y in range(100, height - 100, 40):
+        draw.text((100, y), " ".join(rng.choice(words, 30)), fill="black", font_size=28)
+
+    diagram = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(diagram)
+    for i in range(16):
+        colour = [(200, 30, 30), (30, 120, 200), (40, 180, 60), (240, 200, 40)][i % 4]
+        draw.rectangle((100 + i * 140, 200 + i * 150, 300 + i * 140, 900 + i * 150), fill=colour, outline="black", width=6)
+    draw.line((0, 0, width, height), fill=(90, 90, 90), width=8)
+
+    return {
+        'color': Image.fromarray(np.clip(photo, 0, 255).astype(np.uint8)),
+        'gray': Image.fromarray(np.stack([gray] * 3, axis=2)),
+        'bilevel': scan,
+        'palette': diagram,
+    }
+
+def bench_compress_codecs(level="recommended"):
+    """Per content class: JPEG-only vs content-aware recompression in compress_pdf, time and bytes."""
+    import io
+    from converter import COMPRESS_LEVELS, _recompress_image
+
+    settings = COMPRESS_LEVELS[level]
+    doc = fitz.open()
+    xrefs = {}
+    for name, image in create_codec_benchmark_images().items():
+        png = io.BytesIO()
+        image.save(png, format="PNG")
+        page = doc.new_page()
+        xrefs[name] = page.insert_image(page.rect, stream=png.getvalue())
+    print(f"compress codecs: {level} ({settings['dpi']} DPI, quality {settings['quality']})")
+
+    for name, xref in xrefs.items():
+        info = doc.get_page_images(list(xrefs).index(name))[0]
+        target_size = (round(info[2] * settings['dpi'] / 300), round(info[3] * settings['dpi'] / 300))
+        row = []
+        for content_aware in (False, True):
+            start = time.time()
+            data, _, _, _, encoding = _recompress_image(doc, xref, settings, target_size, content_aware=content_aware)
+            row.append((len(data), time.time() - start, encoding))
+        (jpeg_bytes, jpeg_time, _), (aware_bytes, aware_time, encoding) = row
+        print(f"  {name:<8} jpeg {jpeg_bytes:>9} bytes {jpeg_time:6.2f}s   "
+              f"{encoding['class']:<8} {encoding['filter']:<15} {aware_bytes:>9} bytes {aware_time:6.2f}s   "
+              f"saved {jpeg_bytes - aware_bytes:>9} bytes ({100 * (jpeg_bytes - aware_bytes) / jpeg_bytes:5.1f}%)")
+    doc.close()
+
+def _serve_byte_ranges(data):
+    """Serve data on a local HTTP server that answers Range requests, like a CDN. Returns (server, url)."""
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class RangeHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            start, end = 0, len(data) - 1
+            requested = self.headers.get("Range")
+            if requested:
+                first, last = requested.split("=", 1)[1].split("-")
+                if first:
+                    start, end = int(first), min(int(last or end), end)
+                else:
+                    start = len(data) - int(last)
+            body = data[start:end + 1]
+            self.send_response(206 if requested else 200)
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Length", str(len(body)))
+            if requested:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/document.pdf"
+
+def _first_page_objects(pdf_bytes):
+    """
+    Byte ranges of the objects a viewer must parse to draw page 1, grouped by
+    dependency depth (catalog, page tree, page, its contents/resources, ...):
+    each depth is one more round trip for a viewer fetching objects on demand.
+    Viewers of linearised files skip the first two, the page is named by /O.
+    """
+    import re
+
+    offsets = [(int(m.group(1)), m.start()) for m in re.finditer(rb"(?<![0-9])(\d+) 0 obj", pdf_bytes)]
+    offsets.append((None, pdf_bytes.rfind(b"endobj") + len(b"endobj")))
+    ends = {xref: (start, offsets[i + 1][1]) for i, (xref, start) in enumerate(offsets[:-1])}
+
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    catalog = doc.pdf_catalog()
+    levels, seen = [], set()
+    current = [catalog, int(doc.xref_get_key(catalog, "Pages")[1].split()[0]), doc[0].xref]
+    for xref in current:
+        seen.add(xref)
+    levels.extend([[xref] for xref in current])
+    current = [doc[0].xref]
+    while current:
+        children = []
+        for xref in current:
+            obj = doc.xref_object(xref, compressed=True)
+            obj = re.sub(r"/(Parent|Annots|B|Thumb) (\d+ 0 R|\[[^\]]*\])", "", obj)
+            for ref in re.findall(r"(\d+) 0 R", obj):
+                ref = int(ref)
+                if ref not in seen and ref in ends:
+                    seen.add(ref)
+                    children.append(ref)
+        if children:
+            levels.append(children)
+        current = children
+    doc.close()
+    return [[ends[xref] for xref in level] for level in levels]
+
+def bench_linearized(page_count=60, rtt=0.05, bandwidth=2.5e6):
+    """
+    Time to first page of a large merged PDF, plain vs linearised, fetched from a
+    local byte-range server and scored at the given round-trip time and bandwidth
+    (bytes/s): a plain file needs its trailer and then its page 1 objects one
+    dependency level at a time (or the whole file when streamed); a linearised file
+    needs one request up to the end of its first-page section (/E).
+    """
+    import io
+    import re
+    import urllib.request
+    from PIL import Image
+    from converter import merge_pdf
+
+    parts = []
+    for i in range(page_count):
+        page_doc = fitz.open()
+        page = page_doc.new_page()
+        page.insert_text((50, 50), f"Merged page {i + 1}", fontsize=18)
+        image = Image.effect_noise((800, 600), 60 + i).convert("RGB")
+        jpeg = io.BytesIO()
+        image.save(jpeg, format="JPEG", quality=90)
+        page.insert_image(fitz.Rect(50, 80, 545, 450), stream=jpeg.getvalue())
+        parts.append(page_doc.tobytes())
+        page_doc.close()
+
+    print(f"linearized: {page_count}-page merge, RTT {rtt * 1000:.0f}ms, {bandwidth / 1e6:.1f} MB/s")
+    for linearize in (False, True):
+        start = time.time()
+        pdf_bytes = merge_pdf(parts, linearize=linearize).getvalue()
+        build_time = time.time() - start
+        server, url = _serve_byte_ranges(pdf_bytes)
+        fetched = requests = 0
+
+        def fetch(byte_range):
+            nonlocal fetched, requests
+            request = urllib.request.Request(url, headers={"Range": f"bytes={byte_range}"})
+            with urllib.request.urlopen(request) as response:
+                body = response.read()
+            fetched += len(body)
+            requests += 1
+            return body
+
+        levels = _first_page_objects(pdf_bytes)
+        if linearize:
+            # Linearization dictionary, then everything up to the end of the first page section
+            first_page_end = int(re.search(rb"/E (\d+)", fetch("0-1023")).group(1))
+            fetch(f"1024-{first_page_end - 1}")
+            round_trips = 2
+            streamed = first_page_end
+            missing = sum(1 for level in levels[2:] for _, end in level if end > first_page_end)
+            note = f"first page section, {missing} page 1 objects outside it"
+        else:
+            # Trailer, xref table, then page 1's objects one dependency level at a time
+            startxref = int(re.findall(rb"startxref\s+(\d+)", fetch("-1024"))[-1])
+            fetch(f"{startxref}-{len(pdf_bytes) - 1}")
+            for level in levels:
+                for first, end in level:
+                    fetch(f"{first}-{end - 1}")
+            round_trips = 2 + len(levels)
+            streamed = len(pdf_bytes)
+            note = "whole file when streamed without ranges"
+        server.shutdown()
+
+        label = "linearised" if linearize else "plain"
+        print(f"  {label:<10} {len(pdf_bytes):>9} bytes, built in {build_time:5.2f}s  "
+              f"ranges: {requests} requests, {round_trips} round trips, {fetched:>8} bytes -> "
+              f"{round_trips * rtt + fetched / bandwidth:5.2f}s  "
+              f"streamed: {streamed:>9} bytes -> {rtt + streamed / bandwidth:5.2f}s  ({note})")
+
+BENCHMARKS = {
+    "pdf-to-word": bench_pdf_to_word,
+    "thumbnail-sprites": bench_thumbnail_sprites,
+    "compress-codecs": bench_compress_codecs,
+    "linearized": bench_linearized,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
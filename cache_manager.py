@@ -60,3 +60,280 @@ def clear_old_cache():
                     if time.time() > data["expiry"]:
                         os.remove(file_path)
     except: pass
+
+
+# --- Content-addressed result cache for deterministic converters ---
+# Results are stored on disk under cache/results, keyed by (input hash, function,
+# normalised options, engine version). Least recently used entries are evicted
+# once the directory grows past RESULT_CACHE_MAX_BYTES.
+RESULT_CACHE_DIR = os.path.join(CACHE_DIR, "results")
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 1024 * 1024 * 1024)) # 1GB
+
+if not os.path.exists(RESULT_CACHE_DIR):
+    os.makedirs(RESULT_CACHE_DIR)
+
+def result_cache_enabled():
+    return os.environ.get("ENABLE_RESULT_CACHE", "true").lower() != "false"
+
+def get_input_hash(data):
+    """Hash of a converter input: bytes, or a list of bytes (merge, jpg-to-pdf)."""
+    if isinstance(data, (list, tuple)):
+        return get_hash("|".join(get_hash(item) for item in data))
+    return get_hash(data)
+
+def _freeze(result):
+    """Turn a converter result (BytesIO, list of BytesIO, tuples) into plain bytes for storage."""
+    import io
+    if isinstance(result, io.BytesIO):
+        return ("stream", result.getvalue())
+    if isinstance(result, list):
+        return ("list", [_freeze(item) for item in result])
+    if isinstance(result, tuple):
+        return ("tuple", [_freeze(item) for item in result])
+    return ("value", result)
+
+def _thaw(frozen):
+    """Inverse of _freeze; always hands out fresh BytesIO objects."""
+    import io
+    kind, value = frozen
+    if kind == "stream":
+        return io.BytesIO(value)
+    if kind == "list":
+        return [_thaw(item) for item in value]
+    if kind == "tuple":
+        return tuple(_thaw(item) for item in value)
+    return value
+
+def get_result(key):
+    file_path = os.path.join(RESULT_CACHE_DIR, f"{key}.result")
+    if not result_cache_enabled() or not os.path.exists(file_path):
+        return None
+    try:
+        with open(file_path, "rb") as f:
+            frozen = pickle.load(f)
+        os.utime(file_path) # Mark as recently used for LRU eviction
+        return _thaw(frozen)
+    except Exception as e:
+        print(f"DEBUG: Result cache read error: {e}")
+        return None
+
+def set_result(key, result):
+    if not result_cache_enabled():
+        return
+    file_path = os.path.join(RESULT_CACHE_DIR, f"{key}.result")
+    temp_path = f"{file_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            pickle.dump(_freeze(result), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, file_path)
+        evict_results()
+    except Exception as e:
+        print(f"DEBUG: Result cache write error: {e}")
+        try: os.remove(temp_path)
+        except: pass
+
+def evict_results(max_bytes=None):
+    """Delete least recently used results until the cache fits in max_bytes."""
+    max_bytes = RESULT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    _evict_directory(RESULT_CACHE_DIR, (".result", ".zip"), max_bytes)
+
+# Streamed results (ZIP archives) are stored as the file that was sent, next to
+# the pickled results and under the same budget, so they never sit in memory.
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+def iter_result_stream(key, suffix=".zip"):
+    """Chunks of a stored streamed result, or None when there is none."""
+    file_path = os.path.join(RESULT_CACHE_DIR, f"{key}{suffix}")
+    if not result_cache_enabled() or not os.path.exists(file_path):
+        return None
+    try:
+        f = open(file_path, "rb")
+        os.utime(file_path) # Mark as recently used for LRU eviction
+    except Exception as e:
+        print(f"DEBUG: Result cache read error: {e}")
+        return None
+
+    def read_chunks():
+        with f:
+            while True:
+                chunk = f.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    return read_chunks()
+
+def store_result_stream(key, chunks, suffix=".zip"):
+    """
+    Pass chunks through while writing them to the result cache. The file is only
+    stored once every chunk has been produced; an error or a client that
+    disconnects part-way leaves nothing behind.
+    """
+    if not result_cache_enabled():
+        yield from chunks
+        return
+    file_path = os.path.join(RESULT_CACHE_DIR, f"{key}{suffix}")
+    temp_path = f"{file_path}.{os.getpid()}.{id(chunks)}.tmp"
+    complete = False
+    try:
+        with open(temp_path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+        complete = True
+        os.replace(temp_path, file_path)
+        evict_results()
+    finally:
+        if not complete:
+            try: os.remove(temp_path)
+            except: pass
+
+def cached_result(version="1"):
+    """
+    Decorator for deterministic converters whose first argument is the input
+    bytes (or a list of them). Repeat calls with the same input and options
+    are served from the disk cache. The wrapped function gets a cache_key()
+    helper that returns the key (also used as HTTP ETag) without doing any work;
+    pass it back as result_key= so the input is only hashed once.
+    """
+    import functools
+    import inspect
+
+    def decorator(func):
+        signature = inspect.signature(func)
+        try:
+            import fitz
+            engine = fitz.VersionBind
+        except Exception:
+            engine = "none"
+
+        def cache_key(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            input_data = arguments.pop(next(iter(signature.parameters)))
+            options = json.dumps(arguments, sort_keys=True, default=str)
+            return get_hash(f"{func.__name__}|{version}|{engine}|{get_input_hash(input_data)}|{options}")
+
+        @functools.wraps(func)
+        def wrapper(*args, result_key=None, **kwargs):
+            # result_key: the key the caller already got from cache_key(), saves hashing the input again
+            if not result_cache_enabled():
+                return func(*args, **kwargs)
+            key = result_key or cache_key(*args, **kwargs)
+            cached = get_result(key)
+            if cached is not None:
+                print(f"DEBUG: Result cache hit for {func.__name__}")
+                return cached
+            result = func(*args, **kwargs)
+            # set_result only reads the streams (getvalue), the caller gets them untouched
+            set_result(key, result)
+            return result
+
+        wrapper.cache_key = cache_key
+        return wrapper
+    return decorator
+
+# --- Uploaded documents and page thumbnails ---
+# get-pdf-pages keeps the uploaded PDF under cache/documents (named by content hash)
+# so thumbnails can be rendered lazily, one page per request. Rendered thumbnails
+# are stored under cache/thumbnails keyed by (document hash, page, size), next to
+# the sprite sheets that pack a grid of them into one image.
+DOCUMENT_CACHE_DIR = os.path.join(CACHE_DIR, "documents")
+THUMBNAIL_CACHE_DIR = os.path.join(CACHE_DIR, "thumbnails")
+DOCUMENT_CACHE_MAX_BYTES = int(os.environ.get("DOCUMENT_CACHE_MAX_BYTES", 512 * 1024 * 1024)) # 512MB
+THUMBNAIL_CACHE_MAX_BYTES = int(os.environ.get("THUMBNAIL_CACHE_MAX_BYTES", 256 * 1024 * 1024)) # 256MB
+THUMBNAIL_EVICT_EVERY = 64 # Thumbnails are small; only scan the directory every N writes
+
+_thumbnail_writes = 0
+
+for _directory in (DOCUMENT_CACHE_DIR, THUMBNAIL_CACHE_DIR):
+    if not os.path.exists(_directory):
+        os.makedirs(_directory)
+
+def is_content_hash(value):
+    """True for a sha256 hex digest, the only thing allowed in stored file names."""
+    return isinstance(value, str) and len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+def _write_file_atomic(file_path, data):
+    temp_path = f"{file_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, file_path)
+    except Exception:
+        try: os.remove(temp_path)
+        except: pass
+        raise
+
+def _evict_directory(directory, suffix, max_bytes):
+    """Delete least recently used files ending in suffix until directory fits in max_bytes."""
+    try:
+        entries = []
+        total = 0
+        for filename in os.listdir(directory):
+            if not filename.endswith(suffix):
+                continue
+            stat = os.stat(os.path.join(directory, filename))
+            entries.append((stat.st_mtime, stat.st_size, filename))
+            total += stat.st_size
+        for _, size, filename in sorted(entries):
+            if total <= max_bytes:
+                break
+            os.remove(os.path.join(directory, filename))
+            total -= size
+    except Exception as e:
+        print(f"DEBUG: Cache eviction error in {directory}: {e}")
+
+def store_document(pdf_bytes):
+    """Keep an uploaded PDF on disk and return its content hash (the document id)."""
+    doc_hash = get_hash(pdf_bytes)
+    file_path = os.path.join(DOCUMENT_CACHE_DIR, f"{doc_hash}.pdf")
+    try:
+        if os.path.exists(file_path):
+            os.utime(file_path)
+        else:
+            _write_file_atomic(file_path, pdf_bytes)
+            _evict_directory(DOCUMENT_CACHE_DIR, ".pdf", DOCUMENT_CACHE_MAX_BYTES)
+    except Exception as e:
+        print(f"DEBUG: Document store write error: {e}")
+    return doc_hash
+
+def get_document_path(doc_hash):
+    """Path of a stored PDF, or None if it was never uploaded or has been evicted."""
+    if not is_content_hash(doc_hash):
+        return None
+    file_path = os.path.join(DOCUMENT_CACHE_DIR, f"{doc_hash}.pdf")
+    if not os.path.exists(file_path):
+        return None
+    try: os.utime(file_path)
+    except: pass
+    return file_path
+
+THUMBNAIL_FORMATS = ("jpg", "webp")
+
+def _thumbnail_path(doc_hash, page_number, size, fmt="jpg"):
+    # page_number may also be a sprite sheet name such as 'sprite5x4-0'
+    return os.path.join(THUMBNAIL_CACHE_DIR, f"{doc_hash}_{page_number}_{size or 'native'}.{fmt}")
+
+def get_thumbnail(doc_hash, page_number, size=None, fmt="jpg"):
+    file_path = _thumbnail_path(doc_hash, page_number, size, fmt)
+    if not os.path.exists(file_path):
+        return None
+    try:
+        with open(file_path, "rb") as f:
+            data = f.read()
+        os.utime(file_path)
+        return data
+    except Exception as e:
+        print(f"DEBUG: Thumbnail cache read error: {e}")
+        return None
+
+def set_thumbnail(doc_hash, page_number, size, image_bytes, fmt="jpg"):
+    global _thumbnail_writes
+    try:
+        _write_file_atomic(_thumbnail_path(doc_hash, page_number, size, fmt), image_bytes)
+        _thumbnail_writes += 1
+        if _thumbnail_writes % THUMBNAIL_EVICT_EVERY == 0:
+            _evict_directory(THUMBNAIL_CACHE_DIR, tuple(f".{ext}" for ext in THUMBNAIL_FORMATS), THUMBNAIL_CACHE_MAX_BYTES)
+    except Exception as e:
+        print(f"DEBUG: Thumbnail cache write error: {e}")
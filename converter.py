@@ -4,11 +4,13 @@ import tempfile
 import fitz  # PyMuPDF
 from pdf2docx import Converter
 import ai_service
+import document_profile
+import cache_manager
 import platform
 import subprocess
 import shutil
 import time
-from zipfile import ZipFile, ZIP_DEFLATED
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP_STORED
 from PIL import Image
 
 def needs_ocr(pdf_path):
@@ -17,62 +19,554 @@ def needs_ocr(pdf_path):
     Returns True only if it's truly a scanned document with no fonts and little text.
     """
     try:
-        doc = fitz.open(pdf_path)
-        
-        # 1. Check for fonts. If it has fonts, it's a native PDF.
-        has_fonts = False
-        for i in range(min(len(doc), 5)):
-            if doc[i].get_fonts():
-                has_fonts = True
-                break
-        
-        if has_fonts:
-            doc.close()
-            return False # Native PDF, don't OCR
-            
-        total_text = ""
-        # Check first 10 pages for text density
-        pages_to_check = min(len(doc), 10)
-        is_mainly_images = False
-        
-        for i in range(pages_to_check):
-            page = doc[i]
-            page_text = page.get_text().strip()
-            total_text += page_text
-            
-            # If a page has images but almost no text, and no fonts found earlier
-            if len(page_text) < 10 and page.get_images():
-                is_mainly_images = True
-                break
-        doc.close()
-        
-        # Threshold: if less than 20 characters per page on average and no fonts
-        return is_mainly_images or len(total_text) < (20 * pages_to_check)
+        return document_profile.get_file_profile(pdf_path).needs_ocr
     except:
         return False
 
-def run_ocr(input_path, output_path):
+# Page-selective OCR: worker processes (one page each) and tesseract jobs per page.
+# OCR'd pages are kept in the result cache by the hash of the single-page PDF.
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", os.cpu_count() or 1))
+OCR_TESSERACT_JOBS = int(os.environ.get("OCR_TESSERACT_JOBS", 1))
+OCR_CACHE_VERSION = "v2" # Bump when the ocrmypdf options below change
+
+def _ocr_single_page(page_pdf_bytes, jobs):
+    """Worker: OCR a one-page PDF, returns (ocr_pdf_bytes, seconds)."""
+    import ocrmypdf
+    start_time = time.time()
+    temp_in = None
+    temp_out = None
+    try:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as f:
+            f.write(page_pdf_bytes)
+            temp_in = f.name
+        temp_out = temp_in.replace(".pdf", "_ocr.pdf")
+        # skip-text: only OCR pages that don't have text
+        ocrmypdf.ocr(temp_in, temp_out, skip_text=True, deskew=True, jobs=jobs, progress_bar=False)
+        with open(temp_out, "rb") as f:
+            return f.read(), time.time() - start_time
+    finally:
+        safe_remove(temp_in)
+        safe_remove(temp_out)
+
+def _single_page_pdf(doc, page_number):
+    """
+    One page of doc as a PDF of its own: what the OCR workers get, and hashed as
+    the OCR cache key (see _ocr_cache_key). It holds everything the page draws:
+    content streams, images, forms and vector content. The file ID is left out
+    so the same page always gives the same bytes.
+    """
+    single = fitz.open()
+    single.insert_pdf(doc, from_page=page_number, to_page=page_number)
+    page_bytes = single.tobytes(garbage=3, no_new_id=True)
+    single.close()
+    return page_bytes
+
+def _ocr_cache_key(page_bytes):
+    return f"ocr_{cache_manager.get_hash(OCR_CACHE_VERSION.encode() + page_bytes)}"
+
+def ocr_pages(input_path, output_path, profile=None):
+    """
+    OCR only the image-only pages of input_path (per the DocumentProfile), one
+    page per worker process, reusing cached results for pages seen before.
+    Writes the searchable PDF to output_path and returns stats (1-based page numbers,
+    cached pages, per-page timings in seconds), or None when there was nothing to OCR.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    if profile is None:
+        profile = document_profile.get_file_profile(input_path)
+    page_numbers = [i for i in range(profile.page_count) if profile.is_image_only(i)]
+    if not page_numbers:
+        print("DEBUG: No image-only pages, skipping OCR.")
+        return None
+
+    start_time = time.time()
+    stats = {'pages': [i + 1 for i in page_numbers], 'cached': [], 'timings': {}}
+    ocr_results = {}
+    workers = 0
+
+    with fitz.open(input_path) as doc:
+        pending = {}
+        for i in page_numbers:
+            page_bytes = _single_page_pdf(doc, i)
+            cache_key = _ocr_cache_key(page_bytes)
+            cached = cache_manager.get_result(cache_key)
+            if cached:
+                ocr_results[i] = cached
+                stats['cached'].append(i + 1)
+                continue
+            pending[i] = (cache_key, page_bytes)
+
+        if pending:
+            workers = max(1, min(OCR_WORKERS, len(pending)))
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {
+                    i: pool.submit(_ocr_single_page, page_bytes, OCR_TESSERACT_JOBS)
+                    for i, (_, page_bytes) in pending.items()
+                }
+                for i, future in futures.items():
+                    ocr_bytes, elapsed = future.result()
+                    ocr_results[i] = ocr_bytes
+                    stats['timings'][i + 1] = round(elapsed, 3)
+                    # Result cache: bounded by RESULT_CACHE_MAX_BYTES, least recently used pages go first
+                    cache_manager.set_result(pending[i][0], ocr_bytes)
+                    print(f"DEBUG: OCR page {i + 1} took {elapsed:.2f}s")
+
+        # Rebuild the document: untouched page runs are copied in one insert each
+        out = fitz.open()
+        run_start = None
+        for i in range(doc.page_count):
+            if i in ocr_results:
+                if run_start is not None:
+                    out.insert_pdf(doc, from_page=run_start, to_page=i - 1)
+                    run_start = None
+                with fitz.open(stream=ocr_results[i], filetype="pdf") as ocr_doc:
+                    out.insert_pdf(ocr_doc)
+            elif run_start is None:
+                run_start = i
+        if run_start is not None:
+            out.insert_pdf(doc, from_page=run_start, to_page=doc.page_count - 1)
+        out.save(output_path, garbage=3, deflate=True)
+        out.close()
+
+    print(f"DEBUG: OCR of {len(page_numbers)} pages ({len(stats['cached'])} cached, {workers} workers) took {time.time() - start_time:.2f}s")
+    return stats
+
+def run_ocr(input_path, output_path, profile=None):
     """
     Attempt to run OCR on a PDF to make it searchable.
     Requires ocrmypdf and Tesseract-OCR installed on the system.
+    Only image-only pages are OCR'd, see ocr_pages.
     """
     try:
         import ocrmypdf
         print(f"DEBUG: Running OCR on {input_path}...")
-        # skip-text: only OCR pages that don't have text
-        ocrmypdf.ocr(input_path, output_path, skip_text=True, deskew=True)
-        return True
+        return ocr_pages(input_path, output_path, profile) is not None
     except Exception as e:
         print(f"DEBUG: OCR failed or ocrmypdf not installed: {e}")
         return False
 
-def pdf_to_word(pdf_bytes):
+# Hyper-precise pdf2docx configuration for "Perfection" and layout preservation
+PDF2DOCX_SETTINGS = {
+    'line_margin': 0.1,
+    'word_margin': 0.05,
+    'line_overlap': 0.5,
+    'is_parse_shapes': True,
+    'is_parse_images': True,
+    'is_parse_tables': True,
+    'shape_threshold': 0.1,
+    'min_shape_width': 2.0,
+    'is_extract_hidden_text': True,
+    # Enhanced settings to reduce extra spaces and prevent page overflow
+    'is_collect_images': True,
+    'is_parse_shapes_as_images': False,
+    'line_break_free_space_ratio': 0.01, # Extremely tight
+    'new_paragraph_free_space_ratio': 0.99, # Maximize line grouping
+    'max_line_spacing_ratio': 1.0,       # Minimum spacing
+    'page_margin_factor_top': 0.0,       # Use PDF's exact margins
+    'page_margin_factor_bottom': 0.0,
+    'float_image_ignorable_gap': 100.0,  # Treat images as floating to avoid pushing text
+    # Sharding is done by convert_with_pdf2docx, not by pdf2docx itself
+    'multi_processing': False
+}
+
+# Page-sharded pdf_to_word: number of worker processes and the smallest shard
+# worth paying process start-up and DOCX stitching for.
+PDF_TO_WORD_WORKERS = int(os.environ.get("PDF_TO_WORD_WORKERS", os.cpu_count() or 1))
+PDF_TO_WORD_MIN_SHARD_PAGES = int(os.environ.get("PDF_TO_WORD_MIN_SHARD_PAGES", 8))
+
+def _pdf2docx_convert_range(pdf_path, docx_path, start, end):
+    """Worker: convert pages [start, end) of pdf_path into docx_path."""
+    cv = Converter(pdf_path)
+    try:
+        cv.convert(docx_path, start=start, end=end, **PDF2DOCX_SETTINGS)
+    finally:
+        cv.close()
+    return docx_path
+
+def plan_page_shards(page_count, workers, min_pages=PDF_TO_WORD_MIN_SHARD_PAGES):
+    """
+    Split page_count pages into at most `workers` contiguous (start, end) ranges
+    of at least min_pages pages each. Returns a single range when sharding
+    would not pay off.
+    """
+    if page_count <= 0:
+        return []
+    shard_count = max(1, min(workers, page_count // max(1, min_pages)))
+    base, extra = divmod(page_count, shard_count)
+    shards = []
+    start = 0
+    for i in range(shard_count):
+        end = start + base + (1 if i < extra else 0)
+        shards.append((start, end))
+        start = end
+    return shards
+
+def convert_with_pdf2docx(pdf_path, docx_path, workers=None, start=0, end=None):
+    """
+    Run pdf2docx on pages [start, end) of pdf_path. Large ranges are split into
+    page shards that are converted in a process pool and stitched back into one DOCX.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    if workers is None:
+        workers = PDF_TO_WORD_WORKERS
+
+    if end is None:
+        with fitz.open(pdf_path) as doc:
+            end = doc.page_count
+    page_count = end - start
+    shards = [(start + s, start + e) for s, e in plan_page_shards(page_count, workers)]
+
+    start_time = time.time()
+    if len(shards) <= 1:
+        _pdf2docx_convert_range(pdf_path, docx_path, start, end)
+        print(f"DEBUG: pdf2docx converted {page_count} pages on 1 core in {time.time() - start_time:.2f}s")
+        return docx_path
+
+    part_paths = [docx_path.replace(".docx", f"_part{i}.docx") for i in range(len(shards))]
+    try:
+        with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+            futures = [
+                pool.submit(_pdf2docx_convert_range, pdf_path, part_path, shard_start, shard_end)
+                for part_path, (shard_start, shard_end) in zip(part_paths, shards)
+            ]
+            for future in futures:
+                future.result()
+        print(f"DEBUG: pdf2docx converted {page_count} pages in {len(shards)} shards in {time.time() - start_time:.2f}s")
+
+        merge_start = time.time()
+        merge_docx_parts(part_paths, docx_path)
+        print(f"DEBUG: Stitched {len(shards)} DOCX parts in {time.time() - merge_start:.2f}s")
+    finally:
+        for part_path in part_paths:
+            safe_remove(part_path)
+    return docx_path
+
+def merge_docx_parts(part_paths, output_path):
+    """
+    Append the bodies of several DOCX files (in order) to the first one.
+    Section breaks, styles and embedded media of every part are kept.
+    """
+    from copy import deepcopy
+    from docx import Document
+    from docx.oxml.ns import qn
+
+    base = Document(part_paths[0])
+    base_body = base.element.body
+
+    for part_path in part_paths[1:]:
+        part_doc = Document(part_path)
+
+        # The body-level sectPr closes the last section; turn it into a
+        # paragraph-level section break so the next part starts a new section.
+        body_sect = base_body.find(qn('w:sectPr'))
+        if body_sect is not None:
+            base_body.remove(body_sect)
+            para = base_body.makeelement(qn('w:p'), {})
+            ppr = para.makeelement(qn('w:pPr'), {})
+            ppr.append(body_sect)
+            para.append(ppr)
+            base_body.append(para)
+
+        # Styles pdf2docx created only for this part
+        base_styles = base.styles.element
+        known_ids = {s.get(qn('w:styleId')) for s in base_styles.findall(qn('w:style'))}
+        for style in part_doc.styles.element.findall(qn('w:style')):
+            if style.get(qn('w:styleId')) not in known_ids:
+                base_styles.append(deepcopy(style))
+
+        for child in part_doc.element.body:
+            child = deepcopy(child)
+            _relink_docx_element(child, part_doc.part, base.part)
+            base_body.append(child)
+
+    base.save(output_path)
+    return output_path
+
+def _relink_docx_element(element, src_part, dst_part):
+    """Re-create the relationships (images, hyperlinks) an element refers to in dst_part."""
+    from docx.opc.constants import RELATIONSHIP_TYPE as RT
+    from docx.oxml.ns import qn
+
+    rel_attrs = (qn('r:embed'), qn('r:link'), qn('r:id'))
+    for node in element.iter():
+        for attr in rel_attrs:
+            rId = node.get(attr)
+            if not rId or rId not in src_part.rels:
+                continue
+            rel = src_part.rels[rId]
+            if rel.is_external:
+                new_rId = dst_part.relate_to(rel.target_ref, rel.reltype, is_external=True)
+            elif rel.reltype == RT.IMAGE:
+                # Goes through the package image registry, so identical media is stored once
+                new_rId, _ = dst_part.get_or_add_image(io.BytesIO(rel.target_part.blob))
+            else:
+                new_rId = dst_part.relate_to(rel.target_part, rel.reltype)
+            node.set(attr, new_rId)
+
+# pdf_to_word modes:
+# - 'full': every page through pdf2docx layout analysis
+# - 'fast': DOCX built straight from PyMuPDF text blocks (plain text reports)
+# - 'auto': per-page routing, only table/graphics-heavy pages use pdf2docx
+PDF_TO_WORD_MODES = ('auto', 'fast', 'full')
+PDF_TO_WORD_DEFAULT_MODE = os.environ.get("PDF_TO_WORD_MODE", "auto")
+FAST_PAGE_MAX_SCORE = 5
+
+def build_docx_from_text(pdf_path, docx_path, start=0, end=None):
+    """
+    Fast tier: write pages [start, end) as a DOCX using PyMuPDF text blocks
+    and span fonts only. Each text block becomes one paragraph, each PDF page one section.
+    """
+    from docx import Document
+    from docx.enum.section import WD_SECTION
+    from docx.shared import Pt, RGBColor
+
+    document = Document()
+    with fitz.open(pdf_path) as doc:
+        if end is None:
+            end = doc.page_count
+        for page_index in range(start, end):
+            page = doc[page_index]
+            if page_index == start:
+                section = document.sections[0]
+            else:
+                section = document.add_section(WD_SECTION.NEW_PAGE)
+            section.page_width = Pt(page.rect.width)
+            section.page_height = Pt(page.rect.height)
+
+            for block in page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]:
+                if block["type"] != 0:
+                    continue
+                para = document.add_paragraph()
+                for line_no, line in enumerate(block["lines"]):
+                    if line_no:
+                        para.add_run(" ") # Re-flow wrapped lines into one paragraph
+                    for span in line["spans"]:
+                        if not span["text"]:
+                            continue
+                        run = para.add_run(span["text"])
+                        run.font.size = Pt(round(span["size"] * 2) / 2)
+                        # "ABCDEF+Arial-BoldMT" -> "Arial"
+                        run.font.name = span["font"].split("+")[-1].split("-")[0].split(",")[0]
+                        run.bold = bool(span["flags"] & fitz.TEXT_FONT_BOLD)
+                        run.italic = bool(span["flags"] & fitz.TEXT_FONT_ITALIC)
+                        if span["color"]:
+                            run.font.color.rgb = RGBColor.from_string(f"{span['color']:06X}")
+
+    document.save(docx_path)
+    return docx_path
+
+def convert_pages_routed(pdf_path, docx_path, mode="auto", workers=None, profile=None):
+    """
+    Convert pdf_path to docx_path according to the pdf_to_word mode.
+    In 'auto' mode consecutive pages with the same route are converted together
+    and the resulting parts are stitched in page order.
+    profile: DocumentProfile of pdf_path, built here if not given
+    """
+    import itertools
+
+    if mode == 'full':
+        return convert_with_pdf2docx(pdf_path, docx_path, workers=workers)
+
+    start_time = time.time()
+    if profile is None:
+        profile = document_profile.get_file_profile(pdf_path)
+    if mode == 'fast':
+        routes = ['fast'] * profile.page_count
+    else:
+        routes = [
+            'fast' if profile.page_complexity(i) <= FAST_PAGE_MAX_SCORE else 'full'
+            for i in range(profile.page_count)
+        ]
+    print(f"DEBUG: Routed {routes.count('fast')} fast / {routes.count('full')} full pages in {time.time() - start_time:.2f}s")
+
+    runs = []
+    page_index = 0
+    for route, group in itertools.groupby(routes):
+        run_length = len(list(group))
+        runs.append((route, page_index, page_index + run_length))
+        page_index += run_length
+
+    def convert_run(route, start, end, path):
+        if route == 'fast':
+            return build_docx_from_text(pdf_path, path, start, end)
+        return convert_with_pdf2docx(pdf_path, path, workers=workers, start=start, end=end)
+
+    if len(runs) <= 1:
+        route = runs[0][0] if runs else 'full'
+        return convert_run(route, 0, len(routes), docx_path)
+
+    part_paths = [docx_path.replace(".docx", f"_run{i}.docx") for i in range(len(runs))]
+    try:
+        for part_path, (route, start, end) in zip(part_paths, runs):
+            convert_run(route, start, end, part_path)
+        merge_docx_parts(part_paths, docx_path)
+    finally:
+        for part_path in part_paths:
+            safe_remove(part_path)
+    print(f"DEBUG: Converted {len(runs)} page runs in {time.time() - start_time:.2f}s")
+    return docx_path
+
+# Post-processing targets: 0.5 inch page margins, no paragraph spacing, single line spacing
+DOCX_MARGIN_TWIPS = "720"
+_W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+# pPr children that must come after w:spacing (OOXML schema order)
+_PPR_AFTER_SPACING = {
+    f"{{{_W_NS}}}{name}" for name in (
+        "ind", "contextualSpacing", "mirrorIndents", "suppressOverlap", "jc",
+        "textDirection", "textAlignment", "textboxTightWrap", "outlineLvl",
+        "divId", "cnfStyle", "rPr", "sectPr", "pPrChange",
+    )
+}
+# sectPr children that must come before w:pgMar
+_SECTPR_BEFORE_PGMAR = {
+    f"{{{_W_NS}}}{name}" for name in (
+        "headerReference", "footerReference", "footnotePr", "endnotePr", "type", "pgSz",
+    )
+}
+
+def _w(name):
+    return f"{{{_W_NS}}}{name}"
+
+def _tighten_section(sect_pr):
+    """Set all four page margins of a w:sectPr to DOCX_MARGIN_TWIPS."""
+    pg_mar = sect_pr.find(_w("pgMar"))
+    if pg_mar is None:
+        pg_mar = sect_pr.makeelement(_w("pgMar"), {})
+        index = 0
+        for index, child in enumerate(sect_pr):
+            if child.tag not in _SECTPR_BEFORE_PGMAR:
+                break
+        else:
+            index = len(sect_pr)
+        sect_pr.insert(index, pg_mar)
+    for side in ("top", "bottom", "left", "right"):
+        pg_mar.set(_w(side), DOCX_MARGIN_TWIPS)
+
+def _tighten_paragraph(para):
+    """Zero space before/after and single line spacing on a body-level w:p."""
+    p_pr = para.find(_w("pPr"))
+    if p_pr is None:
+        p_pr = para.makeelement(_w("pPr"), {})
+        para.insert(0, p_pr)
+    spacing = p_pr.find(_w("spacing"))
+    if spacing is None:
+        spacing = p_pr.makeelement(_w("spacing"), {})
+        index = len(p_pr)
+        for i, child in enumerate(p_pr):
+            if child.tag in _PPR_AFTER_SPACING:
+                index = i
+                break
+        p_pr.insert(index, spacing)
+    spacing.set(_w("before"), "0")
+    spacing.set(_w("after"), "0")
+    spacing.set(_w("line"), "240")
+    spacing.set(_w("lineRule"), "auto")
+    sect_pr = p_pr.find(_w("sectPr"))
+    if sect_pr is not None:
+        _tighten_section(sect_pr)
+
+def _rewrite_document_xml(src, dst):
+    """
+    Stream word/document.xml from src to dst, tightening every body-level
+    paragraph and section as it goes. Only one body child is held in memory at a time.
+    """
+    import re
+    from lxml import etree
+
+    events = etree.iterparse(src, events=("start", "end"), remove_blank_text=False, huge_tree=True)
+    _, root = next(events)
+    body_tag = _w("body")
+
+    # Children re-declare every inherited namespace when serialised on their own;
+    # the declarations already on the root element are stripped again.
+    root_decls = {
+        (f' xmlns:{prefix}="{uri}"' if prefix else f' xmlns="{uri}"').encode()
+        for prefix, uri in root.nsmap.items()
+    }
+    ns_decl = re.compile(rb' xmlns(?::[\w.-]+)?="[^"]*"')
+
+    def write_element(elem):
+        chunk = etree.tostring(elem, encoding="UTF-8", xml_declaration=False)
+        head_end = chunk.index(b">")
+        head = ns_decl.sub(lambda m: b"" if m.group(0) in root_decls else m.group(0), chunk[:head_end])
+        dst.write(head + chunk[head_end:])
+
+    def open_tag(elem, nsmap=None):
+        shell = etree.Element(elem.tag, attrib=dict(elem.attrib), nsmap=nsmap)
+        return etree.tostring(shell)[:-2] + b">"
+
+    def tag_name(elem):
+        # Prefix as declared on the root; the default namespace has none (xmlns="...")
+        qname = etree.QName(elem)
+        prefix = next((p for p, uri in root.nsmap.items() if uri == qname.namespace and p), None)
+        return f"{prefix}:{qname.localname}" if prefix else qname.localname
+
+    def close_tag(elem):
+        return f"</{tag_name(elem)}>".encode()
+
+    dst.write(b"<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n")
+    dst.write(open_tag(root, root.nsmap))
+    for event, elem in events:
+        if elem.getparent() is not root:
+            continue
+        if elem.tag == body_tag and event == "start":
+            dst.write(f"<{tag_name(elem)}>".encode())
+            for child_event, child in events:
+                if child_event != "end":
+                    continue
+                if child is elem:
+                    break
+                if child.getparent() is not elem:
+                    continue
+                if child.tag == _w("p"):
+                    _tighten_paragraph(child)
+                elif child.tag == _w("sectPr"):
+                    _tighten_section(child)
+                write_element(child)
+                # Drop what we've written so memory stays flat
+                elem.remove(child)
+            dst.write(close_tag(elem))
+        elif event == "end" and elem.tag != body_tag:
+            write_element(elem)
+            root.remove(elem)
+    dst.write(close_tag(root))
+
+def tighten_docx_layout(input_path, output_path):
+    """
+    Normalise margins and paragraph spacing of a DOCX without loading it into python-docx.
+    word/document.xml is rewritten incrementally; every other part (media included)
+    is copied across unchanged, media stored without re-deflating.
+    """
+    with ZipFile(input_path) as zin, ZipFile(output_path, "w", ZIP_DEFLATED) as zout:
+        for info in zin.infolist():
+            with zin.open(info) as src:
+                if info.filename == "word/document.xml":
+                    with zout.open(info.filename, "w") as dst:
+                        _rewrite_document_xml(src, dst)
+                    continue
+                out_info = ZipInfo(info.filename, date_time=info.date_time)
+                # Images are already compressed, deflating them again only costs CPU
+                out_info.compress_type = ZIP_STORED if info.filename.startswith("word/media/") else ZIP_DEFLATED
+                out_info.external_attr = info.external_attr
+                with zout.open(out_info, "w") as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+    return output_path
+
+def pdf_to_word(pdf_bytes, workers=None, mode=None):
     """
     Convert PDF bytes to Word document using pdf2docx for layout preservation.
     Supports OCR fallback for scanned PDFs.
+    workers: number of processes for page-sharded conversion
+             (defaults to PDF_TO_WORD_WORKERS, 1 disables sharding)
+    mode: 'auto' (default), 'fast' or 'full', see PDF_TO_WORD_MODES
     """
     if not pdf_bytes:
         raise ValueError("PDF file is empty")
+    mode = mode or PDF_TO_WORD_DEFAULT_MODE
+    if mode not in PDF_TO_WORD_MODES:
+        raise ValueError(f"Invalid mode '{mode}'. Use one of: {', '.join(PDF_TO_WORD_MODES)}")
     
     print(f"DEBUG: Starting PDF to Word conversion... Size: {len(pdf_bytes)} bytes")
     temp_pdf = None
@@ -89,88 +583,58 @@ def pdf_to_word(pdf_bytes):
         temp_docx = temp_pdf.replace(".pdf", ".docx")
         
         # 2. Sanitize and Check Encryption
-        # We re-save the PDF to clean internal artifacts that break conversion
+        # Only re-save the PDF when it has internal artifacts that break conversion
         doc = fitz.open(temp_pdf)
         if doc.is_encrypted:
             doc.close()
             raise Exception("This PDF is password protected. Please remove protection before converting.")
             
-        clean_pdf_path = temp_pdf.replace(".pdf", "_clean.pdf")
-        doc.save(clean_pdf_path, garbage=4, deflate=True, clean=True)
+        source_pdf_path = temp_pdf
+        check_start = time.time()
+        profile = document_profile.get_document_profile(pdf_bytes, doc)
+        repair_reason = profile.repair_reason
+        print(f"DEBUG: Sanitize check took {time.time() - check_start:.2f}s ({repair_reason or 'no repair needed'})")
+        
+        if repair_reason:
+            save_start = time.time()
+            clean_pdf_path = temp_pdf.replace(".pdf", "_clean.pdf")
+            doc.save(clean_pdf_path, garbage=4, deflate=True, clean=True)
+            source_pdf_path = clean_pdf_path
+            print(f"DEBUG: Clean re-save took {time.time() - save_start:.2f}s")
         doc.close()
         
         # 3. Ultra-Fidelity OCR Fallback
         # We now use a more aggressive approach: if the layout is complex, we force OCR
         # to "re-build" the document structure from a visual perspective.
-        input_for_conversion = clean_pdf_path
+        input_for_conversion = source_pdf_path
         
         # Check if it's a scanned PDF OR if it looks like a complex educational layout
-        is_scanned = needs_ocr(clean_pdf_path)
+        is_scanned = profile.needs_ocr
         
         if is_scanned:
             print("DEBUG: Complex or scanned layout detected. Attempting Ultra-Fidelity OCR...")
-            ocr_pdf_path = clean_pdf_path.replace(".pdf", "_ocr.pdf")
+            ocr_pdf_path = source_pdf_path.replace(".pdf", "_ocr.pdf")
             # Force OCR even if some text exists to better capture boxes/borders
-            if run_ocr(clean_pdf_path, ocr_pdf_path):
+            if run_ocr(source_pdf_path, ocr_pdf_path, profile):
                 input_for_conversion = ocr_pdf_path
+                profile = None # OCR added a text layer, profile the new file
                 print("DEBUG: OCR reconstruction successful.")
             else:
                 print("DEBUG: OCR failed. Proceeding with standard analysis.")
 
         # 4. Advanced Two-Step Conversion using pdf2docx
-        print(f"DEBUG: Converting {input_for_conversion} with Ultra-Fidelity Parsing...")
-        cv = Converter(input_for_conversion)
-        
-        # Hyper-precise configuration for "Perfection" and layout preservation
-        settings = {
-            'line_margin': 0.1,          
-            'word_margin': 0.05,         
-            'line_overlap': 0.5,        
-            'is_parse_shapes': True,    
-            'is_parse_images': True,    
-            'is_parse_tables': True,    
-            'shape_threshold': 0.1,      
-            'min_shape_width': 2.0,      
-            'is_extract_hidden_text': True,
-            # Enhanced settings to reduce extra spaces and prevent page overflow
-            'is_collect_images': True,           
-            'is_parse_shapes_as_images': False,  
-            'line_break_free_space_ratio': 0.01, # Extremely tight
-            'new_paragraph_free_space_ratio': 0.99, # Maximize line grouping
-            'max_line_spacing_ratio': 1.0,       # Minimum spacing
-            'page_margin_factor_top': 0.0,       # Use PDF's exact margins
-            'page_margin_factor_bottom': 0.0,
-            'float_image_ignorable_gap': 100.0,  # Treat images as floating to avoid pushing text
-            'multi_processing': False            
-        }
-        
-        # Use cv.convert which handles parse and make_docx in one go with the provided settings
-        cv.convert(temp_docx, start=0, end=None, **settings)
-        cv.close()
+        print(f"DEBUG: Converting {input_for_conversion} ({mode} mode)...")
+        convert_pages_routed(input_for_conversion, temp_docx, mode=mode, workers=workers, profile=profile)
         
         # 4.5 POST-PROCESSING: Tighten spacing and margins to fix extra spaces/pages
         try:
-            from docx import Document
-            from docx.shared import Pt
-            doc_obj = Document(temp_docx)
-            
-            # Reset margins to avoid overflow and extra pages
-            for section in doc_obj.sections:
-                section.top_margin = Pt(36)    # 0.5 inch
-                section.bottom_margin = Pt(36)
-                section.left_margin = Pt(36)
-                section.right_margin = Pt(36)
-            
-            # Reset paragraph spacing to avoid "extra spaces"
-            for para in doc_obj.paragraphs:
-                para_format = para.paragraph_format
-                para_format.space_before = Pt(0)
-                para_format.space_after = Pt(0)
-                para_format.line_spacing = 1.0
-                
-            doc_obj.save(temp_docx)
-            print("DEBUG: Post-processing complete. Spacing and margins tightened.")
+            post_start = time.time()
+            tightened_docx = temp_docx.replace(".docx", "_tight.docx")
+            tighten_docx_layout(temp_docx, tightened_docx)
+            os.replace(tightened_docx, temp_docx)
+            print(f"DEBUG: Post-processing complete in {time.time() - post_start:.2f}s. Spacing and margins tightened.")
         except Exception as e:
+            safe_remove(temp_docx.replace(".docx", "_tight.docx"))
             print(f"DEBUG: Post-processing failed: {e}")
         
         # 5. Read Result and Return
@@ -194,12 +658,284 @@ def pdf_to_word(pdf_bytes):
         safe_remove(ocr_pdf_path)
 
 
+class _ZipChunkBuffer(io.RawIOBase):
+    """Unseekable sink for ZipFile that hands written bytes back to stream_zip."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def stream_zip(entries, compression=ZIP_STORED):
+    """
+    Generator-based ZIP writer. entries is an iterable of (name, bytes); each
+    entry is written and its bytes yielded before the next one is produced, so
+    the archive never sits in memory as a whole. Entries default to STORED
+    because JPEG/PNG/PDF members are already compressed.
+    """
+    sink = _ZipChunkBuffer()
+    with ZipFile(sink, 'w', compression) as zip_file:
+        for name, data in entries:
+            info = ZipInfo(name, date_time=time.localtime()[:6])
+            info.compress_type = compression
+            zip_file.writestr(info, data)
+            data = None
+            yield sink.drain()
+    yield sink.drain()
+
+def parse_page_selection(expr, page_count, strict=False):
+    """
+    Parse a page selection shared by split, extract and delete.
+    Returns 0-indexed pages in selection order. Comma-separated items:
+    - '7': one page (1-indexed); '-1' is the last page, '-2' the one before
+    - '1-3', '10-' (to the end), '5-1' (reversed), '-3--1' (last three)
+    - 'odd', 'even', 'last', 'all'
+    Out-of-range pages are dropped (ranges are clamped) unless strict is True,
+    in which case they raise ValueError.
+    """
+    import re
+
+    if isinstance(expr, (list, tuple)):
+        expr = ",".join(str(p) for p in expr)
+    if not expr or not str(expr).strip():
+        raise ValueError("No pages specified")
+
+    def page_index(token):
+        if token == 'last':
+            return page_count - 1
+        try:
+            number = int(token)
+        except ValueError:
+            raise ValueError("use page numbers, ranges such as 1-3 or 10-, odd, even, last or all")
+        if number == 0:
+            raise ValueError("Page numbers start at 1")
+        return page_count + number if number < 0 else number - 1
+
+    def in_range(idx, token):
+        if 0 <= idx < page_count:
+            return True
+        if strict:
+            raise ValueError(f"Invalid page number: {token}")
+        return False
+
+    range_re = re.compile(r'^(-?\d+|last)-(-?\d+|last)?$')
+    pages = []
+    for raw in str(expr).lower().split(','):
+        token = raw.strip().replace(" ", "")
+        if not token:
+            continue
+        if token in ('odd', 'even', 'all'):
+            first = 1 if token == 'even' else 0
+            step = 1 if token == 'all' else 2
+            pages.extend(range(first, page_count, step))
+            continue
+        match = range_re.match(token)
+        if match:
+            try:
+                start = page_index(match.group(1))
+                end = page_index(match.group(2)) if match.group(2) else max(start, page_count - 1)
+            except ValueError as e:
+                raise ValueError(f"Invalid page selection '{raw.strip()}': {e}")
+            if not strict:
+                # A range wholly outside the document is dropped, one partly inside is clamped
+                if (start < 0 and end < 0) or (start >= page_count and end >= page_count):
+                    continue
+                start = min(max(start, 0), page_count - 1)
+                end = min(max(end, 0), page_count - 1)
+            step = 1 if end >= start else -1
+            for idx in range(start, end + step, step):
+                if in_range(idx, token):
+                    pages.append(idx)
+            continue
+        try:
+            idx = page_index(token)
+        except ValueError as e:
+            raise ValueError(f"Invalid page selection '{raw.strip()}': {e}")
+        if in_range(idx, token):
+            pages.append(idx)
+    return pages
+
+def page_runs(pages):
+    """
+    Compress 0-indexed pages into contiguous (from_page, to_page) runs, keeping order.
+    Descending runs (from_page > to_page) come from reversed selections; insert_pdf copies those backwards.
+    """
+    runs = []
+    for page in pages:
+        if runs:
+            start, end = runs[-1]
+            direction = 0 if start == end else (1 if end > start else -1)
+            if page == end + 1 and direction >= 0:
+                runs[-1] = (start, page)
+                continue
+            if page == end - 1 and direction <= 0:
+                runs[-1] = (start, page)
+                continue
+        runs.append((page, page))
+    return runs
+
+def _select_pages(doc, pages):
+    """New document with the given pages (in order), one insert_pdf per contiguous run."""
+    new_doc = fitz.open()
+    for start, end in page_runs(pages):
+        new_doc.insert_pdf(doc, from_page=start, to_page=end)
+    return new_doc
+
+# Split modes that produce several files (returned as ZIP)
+SPLIT_ZIP_MODES = ('single', 'every', 'bookmarks')
+# Split engine: worker processes and how many parts each worker gets per batch
+SPLIT_WORKERS = int(os.environ.get("SPLIT_WORKERS", os.cpu_count() or 1))
+SPLIT_PARTS_PER_BATCH = int(os.environ.get("SPLIT_PARTS_PER_BATCH", 16))
+
+def plan_split_parts(doc, mode, data=None):
+    """
+    Return the output files of a multi-file split as (file_name, from_page, to_page),
+    0-indexed and inclusive.
+    - 'single': one file per page
+    - 'every': one file per N pages (data = N)
+    - 'bookmarks': one file per bookmark of the given outline level (data = level, default 1);
+      pages before the first bookmark go to a front-matter file
+    """
+    import re
+
+    total_pages = doc.page_count
+    if mode == 'single':
+        return [(f"page_{i+1}.pdf", i, i) for i in range(total_pages)]
+
+    if mode == 'every':
+        try:
+            step = int(str(data).strip())
+        except (TypeError, ValueError):
+            raise ValueError("Number of pages per file is missing or invalid (e.g. 5)")
+        if step < 1:
+            raise ValueError("Number of pages per file must be at least 1")
+        return [
+            (f"pages_{start+1}-{min(start + step, total_pages)}.pdf", start, min(start + step, total_pages) - 1)
+            for start in range(0, total_pages, step)
+        ]
+
+    if mode == 'bookmarks':
+        try:
+            level = int(str(data).strip()) if data else 1
+        except ValueError:
+            raise ValueError("Bookmark level must be a whole number (e.g. 1)")
+        if level < 1:
+            raise ValueError("Bookmark level must be at least 1")
+        # Outline entries can point nowhere (page -1), be out of page order or share
+        # a start page: sections follow page order, the first bookmark of a page names it
+        entries = sorted(
+            ((page_no - 1, order, title) for order, (lvl, title, page_no) in enumerate(doc.get_toc(simple=True))
+             if lvl == level and 1 <= page_no <= total_pages)
+        )
+        starts = []
+        for start, _, title in entries:
+            if not starts or starts[-1][1] < start:
+                starts.append((title, start))
+        if not starts:
+            raise ValueError(f"No bookmarks found at level {level}")
+        parts = []
+        if starts[0][1] > 0:
+            parts.append(("00_front_matter.pdf", 0, starts[0][1] - 1))
+        for idx, (title, start) in enumerate(starts):
+            end = starts[idx + 1][1] - 1 if idx + 1 < len(starts) else total_pages - 1
+            safe_title = re.sub(r'[^\w\- ]+', '', title).strip().replace(' ', '_')[:60] or "section"
+            parts.append((f"{idx+1:02d}_{safe_title}.pdf", start, end))
+        return parts
+
+    raise ValueError("Invalid split mode")
+
+def _save_split_part(doc, start, end):
+    """Copy pages [start, end] into a new PDF, keeping only the resources those pages use."""
+    new_doc = fitz.open()
+    new_doc.insert_pdf(doc, from_page=start, to_page=end)
+    # clean=True rebuilds content streams and drops resources the pages never draw
+    # (fonts/images shared through a common resource dictionary), garbage=3 removes them
+    part_bytes = new_doc.tobytes(garbage=3, deflate=True, clean=True)
+    new_doc.close()
+    return part_bytes
+
+def _split_parts_worker(pdf_path, parts, out_dir):
+    """Worker: save a batch of parts to out_dir, returns [(file_name, path, seconds)]."""
+    results = []
+    with fitz.open(pdf_path) as doc:
+        for file_name, start, end in parts:
+            part_start = time.time()
+            part_path = os.path.join(out_dir, file_name)
+            with open(part_path, "wb") as f:
+                f.write(_save_split_part(doc, start, end))
+            results.append((file_name, part_path, time.time() - part_start))
+    return results
+
+def iter_split_parts(pdf_bytes, mode='single', data=None, workers=None):
+    """
+    Split a PDF into several files, yielding (file_name, pdf_bytes) in order.
+    Large splits are sharded across worker processes in batches; workers write
+    parts to a temp dir so only the part being sent is held in memory.
+    Progress and per-part timings go to the DEBUG log.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    if workers is None:
+        workers = SPLIT_WORKERS
+
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        parts = plan_split_parts(doc, mode, data)
+        total = len(parts)
+        start_time = time.time()
+
+        batches = [parts[i:i + SPLIT_PARTS_PER_BATCH] for i in range(0, total, SPLIT_PARTS_PER_BATCH)]
+        if workers <= 1 or len(batches) <= 1:
+            for done, (file_name, start, end) in enumerate(parts, 1):
+                part_start = time.time()
+                part_bytes = _save_split_part(doc, start, end)
+                print(f"DEBUG: Split part {done}/{total} {file_name} ({end - start + 1} pages) took {time.time() - part_start:.3f}s")
+                yield file_name, part_bytes
+            print(f"DEBUG: Split {total} parts on 1 core in {time.time() - start_time:.2f}s")
+            return
+    finally:
+        doc.close()
+
+    temp_dir = tempfile.mkdtemp()
+    pdf_path = os.path.join(temp_dir, "input.pdf")
+    try:
+        with open(pdf_path, "wb") as f:
+            f.write(pdf_bytes)
+        done = 0
+        with ProcessPoolExecutor(max_workers=min(workers, len(batches))) as pool:
+            futures = [pool.submit(_split_parts_worker, pdf_path, batch, temp_dir) for batch in batches]
+            for future in futures:
+                for file_name, part_path, elapsed in future.result():
+                    done += 1
+                    print(f"DEBUG: Split part {done}/{total} {file_name} took {elapsed:.3f}s")
+                    with open(part_path, "rb") as f:
+                        part_bytes = f.read()
+                    safe_remove(part_path)
+                    yield file_name, part_bytes
+        print(f"DEBUG: Split {total} parts with {min(workers, len(batches))} workers in {time.time() - start_time:.2f}s")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+@cache_manager.cached_result()
 def split_pdf(pdf_bytes, mode, data=None):
     """
     Split PDF based on mode:
     - 'single': Split every page into its own PDF file (returns ZIP)
-    - 'range': Extract a range of pages (e.g., '1-3')
-    - 'extract': Extract specific pages (e.g., '1, 3, 5')
+    - 'every': Split into files of N pages each (e.g., '5', returns ZIP)
+    - 'bookmarks': One file per bookmark (data = outline level, default 1, returns ZIP)
+    - 'range': Extract a range of pages (e.g., '1-3', '10-', '5-1')
+    - 'extract': Extract specific pages (e.g., '1, 3, 5', 'odd', '-1')
+    'range' and 'extract' accept the same selection syntax, see parse_page_selection.
     """
     if not pdf_bytes:
         raise ValueError("PDF file is empty")
@@ -207,66 +943,35 @@ def split_pdf(pdf_bytes, mode, data=None):
     doc = fitz.open(stream=pdf_bytes, filetype="pdf")
     total_pages = len(doc)
     
-    if mode == 'single':
-        zip_buffer = io.BytesIO()
-        with ZipFile(zip_buffer, 'w', ZIP_DEFLATED) as zip_file:
-            for i in range(total_pages):
-                new_doc = fitz.open()
-                new_doc.insert_pdf(doc, from_page=i, to_page=i)
-                pdf_out = io.BytesIO()
-                new_doc.save(pdf_out)
-                new_doc.close()
-                zip_file.writestr(f"page_{i+1}.pdf", pdf_out.getvalue())
+    if mode in SPLIT_ZIP_MODES:
         doc.close()
+        zip_buffer = io.BytesIO()
+        for chunk in stream_zip(iter_split_parts(pdf_bytes, mode, data)):
+            zip_buffer.write(chunk)
         zip_buffer.seek(0)
         return zip_buffer, True # True means it's a ZIP
         
-    elif mode == 'range':
-        if not data: raise ValueError("Range data is missing (e.g. 1-3)")
-        try:
-            # Handle possible spaces
-            data = data.replace(" ", "")
-            start, end = map(int, data.split('-'))
-            # Convert to 0-indexed and handle bounds
-            start_idx = max(0, start - 1)
-            end_idx = min(total_pages - 1, end - 1)
-            
-            if start_idx > end_idx:
-                raise ValueError("Start page cannot be greater than end page")
-                
-            new_doc = fitz.open()
-            new_doc.insert_pdf(doc, from_page=start_idx, to_page=end_idx)
-            pdf_out = io.BytesIO()
-            new_doc.save(pdf_out)
-            new_doc.close()
+    elif mode in ('range', 'extract'):
+        if not data:
             doc.close()
-            pdf_out.seek(0)
-            return pdf_out, False
-        except Exception as e:
-            if "Start page" in str(e): raise e
-            raise ValueError(f"Invalid range format: {str(e)}")
-            
-    elif mode == 'extract':
-        if not data: raise ValueError("Page data is missing (e.g. 1, 3, 5)")
+            if mode == 'range': raise ValueError("Range data is missing (e.g. 1-3)")
+            raise ValueError("Page data is missing (e.g. 1, 3, 5)")
         try:
-            pages = [int(p.strip()) - 1 for p in data.split(',') if p.strip()]
-            # Filter valid pages
-            valid_pages = [p for p in pages if 0 <= p < total_pages]
-            
-            if not valid_pages: raise ValueError("No valid pages selected within document range")
-            
-            new_doc = fitz.open()
-            for p in valid_pages:
-                new_doc.insert_pdf(doc, from_page=p, to_page=p)
-            pdf_out = io.BytesIO()
-            new_doc.save(pdf_out)
-            new_doc.close()
+            pages = parse_page_selection(data, total_pages)
+        except ValueError:
             doc.close()
-            pdf_out.seek(0)
-            return pdf_out, False
-        except Exception as e:
-            if "No valid pages" in str(e): raise e
-            raise ValueError(f"Invalid page format: {str(e)}")
+            raise
+        if not pages:
+            doc.close()
+            raise ValueError("No valid pages selected within document range")
+            
+        new_doc = _select_pages(doc, pages)
+        pdf_out = io.BytesIO()
+        new_doc.save(pdf_out)
+        new_doc.close()
+        doc.close()
+        pdf_out.seek(0)
+        return pdf_out, False
     
     doc.close()
     raise ValueError("Invalid split mode")
@@ -321,6 +1026,7 @@ def word_to_pdf_linux(docx_bytes):
             except:
                 pass
 
+@cache_manager.cached_result()
 def word_to_pdf(docx_bytes):
     """
     Convert Word to PDF using best available method:
@@ -458,6 +1164,10 @@ def excel_to_pdf_windows(excel_bytes):
         safe_remove(output_pdf_path)
 
 
+PAGE_NUMBER_POSITIONS = ('bottom-center', 'top-left', 'top-center', 'top-right', 'bottom-left', 'bottom-right')
+PAGE_NUMBER_MARGINS = ('recommended', 'small', 'big')
+
+@cache_manager.cached_result()
 def add_page_numbers(pdf_bytes, options):
     """
     Add page numbers to PDF with flexible positioning and styling.
@@ -470,7 +1180,16 @@ def add_page_numbers(pdf_bytes, options):
     }
     """
     doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    
+    _stamp_page_numbers(doc, options)
+
+    output_stream = io.BytesIO()
+    doc.save(output_stream)
+    doc.close()
+    output_stream.seek(0)
+    return output_stream
+
+def _stamp_page_numbers(doc, options):
+    """Draw the page numbers of add_page_numbers onto an open document."""
     position = options.get('position', 'bottom-center')
     margin_type = options.get('margin', 'recommended')
     start_number = int(options.get('first_number', 1))
@@ -560,12 +1279,6 @@ def add_page_numbers(pdf_bytes, options):
         # Draw text
         page.insert_text((pos_x, pos_y), text, fontsize=font_size, fontname="helv", color=font_color)
 
-    output_stream = io.BytesIO()
-    doc.save(output_stream)
-    doc.close()
-    output_stream.seek(0)
-    return output_stream
-
 
 def verify_pdf(stream):
     """
@@ -607,6 +1320,12 @@ def verify_excel(stream):
     except:
         return False
 
+def _encryption_options(password):
+    """doc.save() arguments that protect the output with password."""
+    # owner_pw can be same as user_pw if not specified.
+    return {'owner_pw': password, 'user_pw': password,
+            'encryption': fitz.PDF_ENCRYPT_AES_256} # Use strong encryption
+
 def protect_pdf(pdf_bytes, password):
     """
     Password protect a PDF using PyMuPDF (fitz)
@@ -624,15 +1343,7 @@ def protect_pdf(pdf_bytes, password):
         output_stream = io.BytesIO()
         # permissions: 0 is no permissions except viewing? 
         # Actually fitz.PDF_PERM_PRINT etc are bits. 0 means very restricted.
-        # owner_pw can be same as user_pw if not specified.
-        doc.save(
-            output_stream,
-            owner_pw=password,
-            user_pw=password,
-            encryption=fitz.PDF_ENCRYPT_AES_256, # Use strong encryption
-            garbage=3,
-            deflate=True
-        )
+        doc.save(output_stream, garbage=3, deflate=True, **_encryption_options(password))
         doc.close()
         
         output_stream.seek(0)
@@ -642,35 +1353,277 @@ def protect_pdf(pdf_bytes, password):
         raise Exception(f"Protect PDF failed: {str(e)}")
 
 
-def pdf_to_jpg(pdf_bytes):
+# Rasterisation defaults: zoom 2.0 (144 DPI) is what pdf-to-jpg/png always produced
+RASTER_DEFAULT_DPI = 144
+RASTER_MIN_DPI = 18
+RASTER_MAX_DPI = 600
+JPEG_DEFAULT_QUALITY = 95
+# Largest uncompressed pixmap rendered in one piece; bigger PNG pages are rendered in bands.
+# JPEG pages are not: the JPEG encoders (MuPDF's and Pillow's) take the whole image,
+# so reassembling bands would allocate the same full-page buffer. Their pixmap is
+# bounded by RASTER_MAX_DPI instead.
+RASTER_MEMORY_BUDGET = int(os.environ.get("RASTER_MEMORY_BUDGET", 32 * 1024 * 1024)) # 32MB
+
+def validate_raster_options(fmt, dpi=RASTER_DEFAULT_DPI, quality=None, compress_level=None,
+                            grayscale=False, alpha=False, passthrough=False):
+    """Raise ValueError for rasterisation options the renderer cannot honour (pages are checked when rendering)."""
+    if not RASTER_MIN_DPI <= dpi <= RASTER_MAX_DPI:
+        raise ValueError(f"DPI must be between {RASTER_MIN_DPI} and {RASTER_MAX_DPI}")
+    if quality is not None and not 1 <= quality <= 100:
+        raise ValueError("JPEG quality must be between 1 and 100")
+    if compress_level is not None and not 0 <= compress_level <= 9:
+        raise ValueError("PNG compression level must be between 0 and 9")
+    if alpha and fmt != "png":
+        raise ValueError("Transparency is only supported for PNG")
+    if alpha and grayscale:
+        raise ValueError("Transparency is only supported for colour images, not grayscale")
+    if passthrough and fmt != "jpg":
+        raise ValueError("Passthrough is only supported for JPG")
+
+def _raster_pages(pdf_document, pages=None):
+    """
+    0-indexed pages to render: all of them, or a page selection (see parse_page_selection).
+    A page selected twice ('1,1', '1-3,2') is rendered once, where it first appears.
+    """
+    if pages is None or not str(pages).strip():
+        return list(range(pdf_document.page_count))
+    selected = list(dict.fromkeys(parse_page_selection(pages, pdf_document.page_count)))
+    if not selected:
+        raise ValueError("No valid pages selected within document range")
+    return selected
+
+def _encode_pixmap(pix, fmt, quality=None, compress_level=None):
+    if fmt == "png":
+        if compress_level is None:
+            return pix.tobytes("png")
+        # MuPDF's PNG writer has no level setting; hand the samples to Pillow's zlib instead
+        image = Image.frombytes({1: "L", 2: "LA", 3: "RGB", 4: "RGBA"}[pix.n], (pix.width, pix.height), pix.samples)
+        out = io.BytesIO()
+        image.save(out, format="PNG", compress_level=compress_level)
+        return out.getvalue()
+    return pix.tobytes("jpeg", jpg_quality=quality or JPEG_DEFAULT_QUALITY)
+
+def _png_chunk(tag, data):
+    import struct
+    import zlib
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+
+def _render_png_in_bands(page, mat, colorspace, alpha=False, compress_level=None, budget=None):
+    """
+    Render one page to PNG in horizontal bands so at most budget bytes of pixels
+    are alive at a time. Each band is rendered from the page's display list with
+    a clip rectangle and its rows go straight into one zlib stream (IDAT chunks).
+    Apart from anti-aliasing on clipped edges the image matches a full-page render.
+    """
+    import zlib
+
+    budget = budget or RASTER_MEMORY_BUDGET
+    bbox = fitz.IRect((page.rect * mat).irect)
+    n = colorspace.n + (1 if alpha else 0)
+    stride = bbox.width * n
+    band_rows = max(1, budget // stride)
+    color_type = {1: 0, 2: 4, 3: 2, 4: 6}[n]
+
+    out = io.BytesIO()
+    out.write(b"\x89PNG\r\n\x1a\n")
+    out.write(_png_chunk(b"IHDR", bbox.width.to_bytes(4, "big") + bbox.height.to_bytes(4, "big") + bytes([8, color_type, 0, 0, 0])))
+    compressor = zlib.compressobj(6 if compress_level is None else compress_level)
+    display_list = page.get_displaylist()
+    for y0 in range(bbox.y0, bbox.y1, band_rows):
+        band = fitz.IRect(bbox.x0, y0, bbox.x1, min(y0 + band_rows, bbox.y1))
+        pix = display_list.get_pixmap(matrix=mat, colorspace=colorspace, alpha=alpha, clip=fitz.Rect(band) * ~mat)
+        if fitz.IRect(pix.irect) != band:
+            # Clip rounding gave a row more or less: copy into a pixmap of exactly the band
+            exact = fitz.Pixmap(colorspace, band, alpha)
+            exact.clear_with(0 if alpha else 255)
+            exact.copy(pix, band)
+            pix = exact
+        samples = pix.samples_mv
+        data = []
+        for i in range(0, len(samples), stride):
+            # Filter type 0 (none) per row, like MuPDF's own PNG writer
+            data.append(compressor.compress(b"\x00"))
+            data.append(compressor.compress(samples[i:i + stride]))
+        samples = pix = None
+        data = b"".join(data)
+        if data:
+            out.write(_png_chunk(b"IDAT", data))
+    out.write(_png_chunk(b"IDAT", compressor.flush()))
+    out.write(_png_chunk(b"IEND", b""))
+    print(f"DEBUG: Rendered {bbox.width}x{bbox.height} page {page.number + 1} in bands of {band_rows} rows")
+    return out.getvalue()
+
+def _exif_orientation(matrix):
+    """
+    EXIF orientation (1, 3, 6 or 8) that shows an image placed with matrix
+    (image unit square to displayed page) upright, or None for skewed or
+    mirrored placements.
+    """
+    x_axis = fitz.Point(1, 0) * matrix - fitz.Point(0, 0) * matrix
+    y_axis = fitz.Point(0, 1) * matrix - fitz.Point(0, 0) * matrix
+    directions = tuple((int(round(p.x / abs(p))), int(round(p.y / abs(p)))) if abs(p) else None for p in (x_axis, y_axis))
+    return {
+        ((1, 0), (0, 1)): 1,
+        ((-1, 0), (0, -1)): 3,
+        ((0, 1), (-1, 0)): 6,
+        ((0, -1), (1, 0)): 8,
+    }.get(directions) if abs(x_axis.x * x_axis.y) < 1e-3 else None
+
+def _jpeg_has_exif(data):
+    """True if a JPEG carries an APP1 Exif segment (its own orientation would fight ours)."""
+    i = 2
+    while i + 4 <= len(data) and data[i] == 0xFF and data[i + 1] not in (0xD9, 0xDA):
+        length = int.from_bytes(data[i + 2:i + 4], "big")
+        if data[i + 1] == 0xE1 and data[i + 4:i + 10] == b"Exif\x00\x00":
+            return True
+        i += 2 + length
+    return False
+
+def _with_exif_orientation(data, orientation):
+    """Insert a minimal APP1 Exif segment holding only the Orientation tag, after SOI/APP0."""
+    tiff = b"MM\x00\x2a\x00\x00\x00\x08" + b"\x00\x01" + b"\x01\x12\x00\x03\x00\x00\x00\x01" + orientation.to_bytes(2, "big") + b"\x00\x00" + b"\x00\x00\x00\x00"
+    payload = b"Exif\x00\x00" + tiff
+    segment = b"\xff\xe1" + (len(payload) + 2).to_bytes(2, "big") + payload
+    i = 2
+    if data[2:4] == b"\xff\xe0":
+        i += 2 + int.from_bytes(data[4:6], "big")
+    return data[:i] + segment + data[i:]
+
+def _jpeg_passthrough(doc, page, grayscale=False):
+    """
+    Original JPEG bytes of a scanned page: exactly one DCT image (no soft mask or
+    Decode array) covering the whole page, with no text or vector content, placed
+    upright or turned by a multiple of 90 degrees (recorded as EXIF orientation).
+    Returns None when the page has to be rendered instead.
+    """
+    images = page.get_images(full=True)
+    if len(images) != 1 or images[0][1] or images[0][8] != "DCTDecode":
+        return None
+    bboxlog = page.get_bboxlog()
+    if len(bboxlog) != 1 or bboxlog[0][0] != "fill-image":
+        return None
+    # bbox log and image transform are in unrotated page space
+    page_rect = page.rect * page.derotation_matrix
+    if any(abs(a - b) > 1 for a, b in zip(fitz.Rect(bboxlog[0][1]), page_rect)):
+        return None
+
+    xref = images[0][0]
+    if doc.xref_get_key(xref, "Decode")[0] != "null":
+        return None
+    info = page.get_image_info(xrefs=True)
+    if len(info) != 1:
+        return None
+    orientation = _exif_orientation(fitz.Matrix(info[0]["transform"]) * page.rotation_matrix)
+    if orientation is None:
+        return None
+
+    image = doc.extract_image(xref)
+    if image.get("ext") != "jpeg" or image.get("colorspace") not in ((1,) if grayscale else (1, 3)):
+        return None
+    data = image["image"]
+    if _jpeg_has_exif(data):
+        return None
+    return data if orientation == 1 else _with_exif_orientation(data, orientation)
+
+def iter_pdf_page_images(pdf_bytes, fmt="jpg", dpi=RASTER_DEFAULT_DPI, quality=None, compress_level=None,
+                         grayscale=False, alpha=False, pages=None, passthrough=False, stats=None):
+    """
+    Render PDF pages one at a time, yielding (file_name, image_bytes).
+    Only one page's pixmap is alive at any moment, and only the selected pages
+    are rendered, at the requested DPI, colour space and encoder setting.
+    PNG pages larger than RASTER_MEMORY_BUDGET are rendered in bands; JPEG pages are
+    always rendered in one piece (see RASTER_MEMORY_BUDGET).
+    With passthrough (JPG without a quality setting), scanned pages that are one
+    full-page JPEG are returned as that original JPEG at its own resolution.
+    stats: optional dict, filled with 'pages' and 'passthrough_pages' as pages are yielded.
+    """
+    validate_raster_options(fmt, dpi, quality, compress_level, grayscale, alpha, passthrough)
+    passthrough = passthrough and fmt == "jpg" and quality is None
+    pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        zoom = dpi / 72.0
+        mat = fitz.Matrix(zoom, zoom)
+        colorspace = fitz.csGRAY if grayscale else fitz.csRGB
+        stats = {} if stats is None else stats
+        stats.update(pages=0, passthrough_pages=0)
+        for page_num in _raster_pages(pdf_document, pages):
+            page = pdf_document[page_num]
+            bbox = (page.rect * mat).irect
+            img_bytes = _jpeg_passthrough(pdf_document, page, grayscale) if passthrough else None
+            if img_bytes is not None:
+                stats['passthrough_pages'] += 1
+            elif fmt == "png" and bbox.width * bbox.height * (colorspace.n + alpha) > RASTER_MEMORY_BUDGET:
+                img_bytes = _render_png_in_bands(page, mat, colorspace, alpha, compress_level)
+            else:
+                pix = page.get_pixmap(matrix=mat, colorspace=colorspace, alpha=alpha)
+                img_bytes = _encode_pixmap(pix, fmt, quality, compress_level)
+                pix = None
+            stats['pages'] += 1
+            yield f"page_{page_num + 1}.{fmt}", img_bytes
+        if passthrough:
+            print(f"DEBUG: {stats['passthrough_pages']} pages were a single JPEG, passed through without rendering")
+    finally:
+        pdf_document.close()
+
+def iter_embedded_images(pdf_bytes, pages=None, min_size=0):
+    """
+    Yield (file_name, image_bytes) for every unique image embedded in the PDF, in
+    its stored encoding (JPEG, JPEG 2000, ...; raw bitmaps come out as PNG) without
+    rendering anything. Images are deduplicated by xref and by content hash, and
+    images smaller than min_size pixels on both sides (icons, bullets) are skipped.
+    """
+    if not pdf_bytes:
+        raise ValueError("PDF file is empty")
+
+    import hashlib
+
+    pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        seen_xrefs = set()
+        seen_hashes = set()
+        count = 0
+        for page_num in _raster_pages(pdf_document, pages):
+            for image in pdf_document[page_num].get_images(full=True):
+                xref, width, height = image[0], image[2], image[3]
+                if xref in seen_xrefs:
+                    continue
+                seen_xrefs.add(xref)
+                if width < min_size and height < min_size:
+                    continue
+                extracted = pdf_document.extract_image(xref)
+                if not extracted or not extracted.get("image"):
+                    continue
+                digest = hashlib.sha256(extracted["image"]).digest()
+                if digest in seen_hashes:
+                    continue
+                seen_hashes.add(digest)
+                count += 1
+                yield f"image_{count:03d}_page_{page_num + 1}.{extracted['ext']}", extracted["image"]
+        print(f"DEBUG: Extracted {count} unique images from {len(seen_xrefs)} image xrefs")
+        if count == 0:
+            raise ValueError("No embedded images found in the PDF")
+    finally:
+        pdf_document.close()
+
+@cache_manager.cached_result()
+def pdf_to_jpg(pdf_bytes, dpi=RASTER_DEFAULT_DPI, quality=None, grayscale=False, pages=None, passthrough=False):
     """
     Convert PDF pages to JPG images using PyMuPDF (fitz) for speed and accuracy
+    passthrough: return scanned pages' embedded JPEGs as-is instead of rendering them
     Returns a list of BytesIO objects, each containing a JPG image
     """
     if not pdf_bytes:
         raise ValueError("PDF file is empty")
     
     try:
-        pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
-        image_streams = []
-        
-        for page_num in range(pdf_document.page_count):
-            page = pdf_document[page_num]
-            # Use higher zoom for better quality (300 DPI)
-            zoom = 2.0
-            mat = fitz.Matrix(zoom, zoom)
-            pix = page.get_pixmap(matrix=mat, colorspace=fitz.csRGB)
-            
-            img_stream = io.BytesIO(pix.tobytes("jpg"))
-            image_streams.append(img_stream)
-            
-        pdf_document.close()
-        return image_streams
-        
+        entries = iter_pdf_page_images(pdf_bytes, "jpg", dpi=dpi, quality=quality, grayscale=grayscale,
+                                       pages=pages, passthrough=passthrough)
+        return [io.BytesIO(img_bytes) for _, img_bytes in entries]
     except Exception as e:
         raise Exception(f"PDF to JPG conversion failed: {str(e)}")
 
-def pdf_to_png(pdf_bytes):
+@cache_manager.cached_result()
+def pdf_to_png(pdf_bytes, dpi=RASTER_DEFAULT_DPI, compress_level=None, grayscale=False, alpha=False, pages=None):
     """
     Convert PDF pages to PNG images using PyMuPDF (fitz)
     Returns a list of BytesIO objects, each containing a PNG image
@@ -679,44 +1632,61 @@ def pdf_to_png(pdf_bytes):
         raise ValueError("PDF file is empty")
     
     try:
-        pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
-        image_streams = []
-        
-        for page_num in range(pdf_document.page_count):
-            page = pdf_document[page_num]
-            # Use higher zoom for better quality
-            zoom = 2.0
-            mat = fitz.Matrix(zoom, zoom)
-            pix = page.get_pixmap(matrix=mat, colorspace=fitz.csRGB)
-            
-            img_stream = io.BytesIO(pix.tobytes("png"))
-            image_streams.append(img_stream)
-            
-        pdf_document.close()
-        return image_streams
-        
+        entries = iter_pdf_page_images(pdf_bytes, "png", dpi=dpi, compress_level=compress_level,
+                                       grayscale=grayscale, alpha=alpha, pages=pages)
+        return [io.BytesIO(img_bytes) for _, img_bytes in entries]
     except Exception as e:
         raise Exception(f"PDF to PNG conversion failed: {str(e)}")
 
+# EXIF orientation -> insert_image rotation (anti-clockwise) that shows the photo upright
+EXIF_ROTATIONS = {1: 0, 3: 180, 6: 270, 8: 90}
+
 def jpg_to_pdf(image_bytes_list):
     """
-    Convert multiple JPG images into a single PDF using Pillow
+    Convert multiple images into a single PDF, one page per image sized like Pillow's
+    (1 pixel = 1 point). Baseline RGB/grayscale JPEGs are embedded as they are
+    (DCTDecode, no re-encode) with EXIF orientation applied through the page
+    rotation, and PNGs go to MuPDF directly. Only CMYK JPEGs, mirrored EXIF
+    orientations and formats MuPDF cannot read (WebP, ...) are decoded with Pillow.
+    Images are handled one at a time so memory does not grow with the count.
     """
     if not image_bytes_list:
         raise ValueError("No images provided")
     
     try:
-        images = []
+        from PIL import ImageOps
+        
+        pdf_document = fitz.open()
+        embedded = 0
         for img_bytes in image_bytes_list:
-            img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-            images.append(img)
+            # Opening only reads the header; pixels are decoded on the fallback path only
+            img = Image.open(io.BytesIO(img_bytes))
+            rotation = EXIF_ROTATIONS.get(img.getexif().get(0x0112, 1))
+            width, height = img.size
             
-        if not images:
-            raise ValueError("Could not process images")
+            if img.format in ("JPEG", "PNG") and img.mode != "CMYK" and rotation is not None:
+                stream = img_bytes
+                if rotation in (90, 270):
+                    width, height = height, width
+                embedded += 1
+            else:
+                img = ImageOps.exif_transpose(img).convert("RGB")
+                width, height = img.size
+                out = io.BytesIO()
+                img.save(out, format="JPEG", quality=95)
+                stream, rotation = out.getvalue(), 0
+            img = None
             
-        pdf_stream = io.BytesIO()
-        images[0].save(pdf_stream, format="PDF", save_all=True, append_images=images[1:], optimize=True)
-        pdf_stream.seek(0)
+            page = pdf_document.new_page(width=width, height=height)
+            page.insert_image(page.rect, stream=stream, rotate=rotation)
+            stream = None
+        
+        if pdf_document.page_count == 0:
+            raise ValueError("Could not process images")
+        
+        print(f"DEBUG: Built PDF from {pdf_document.page_count} images, {embedded} embedded without re-encoding")
+        pdf_stream = io.BytesIO(pdf_document.tobytes(garbage=3, deflate=True))
+        pdf_document.close()
         return pdf_stream
         
     except Exception as e:
@@ -1031,39 +2001,341 @@ def com_retry(func, *args, **kwargs):
     raise last_err
 
 
-def rotate_pdf(pdf_bytes, angle=90):
+def is_linearized(pdf_bytes):
+    """True if pdf_bytes starts with a linearization dictionary ("fast web view")."""
+    return b"/Linearized" in pdf_bytes[:1024]
+
+def linearize_pdf(pdf_bytes):
+    """
+    Rewrite a PDF linearised ("fast web view"): the first page's objects and the
+    hint tables come first, so a viewer can show page 1 before the download ends.
+    MuPDF no longer writes linearised files, so this goes through pikepdf (qpdf);
+    without pikepdf the PDF is returned unchanged (see is_linearized).
+    """
+    try:
+        import pikepdf
+    except ImportError:
+        print("DEBUG: pikepdf not installed. Returning non-linearised PDF.")
+        return pdf_bytes
+    
+    try:
+        start_time = time.time()
+        output_stream = io.BytesIO()
+        with pikepdf.open(io.BytesIO(pdf_bytes)) as pdf:
+            # preserve: keeps object streams written with use_objstms
+            pdf.save(output_stream, linearize=True, object_stream_mode=pikepdf.ObjectStreamMode.preserve)
+        print(f"DEBUG: Linearised {len(pdf_bytes)} bytes in {time.time() - start_time:.2f}s")
+        return output_stream.getvalue()
+    except Exception as e:
+        raise Exception(f"Linearize PDF failed: {str(e)}")
+
+def save_incremental(pdf_bytes, edit):
+    """
+    Apply edit(doc) to pdf_bytes and append only the changed objects as an
+    incremental update: the original bytes are kept as they are (so signatures
+    stay valid) and no stream is reparsed or recompressed, the cost grows with
+    the edited objects instead of the file size. Returns the updated bytes, or
+    None when the file cannot be updated incrementally (encrypted or repaired).
+    """
+    temp_dir = tempfile.mkdtemp()
+    pdf_path = os.path.join(temp_dir, "input.pdf")
+    try:
+        start_time = time.time()
+        # MuPDF appends the update to the file it opened, it can't do that for a memory stream
+        with open(pdf_path, "wb") as f:
+            f.write(pdf_bytes)
+        with fitz.open(pdf_path) as doc:
+            if doc.is_encrypted or not doc.can_save_incrementally():
+                print("DEBUG: PDF can't be updated incrementally. Doing a full save.")
+                return None
+            edit(doc)
+            # Append the changed objects to the opened file, keeping its encryption settings
+            doc.save(pdf_path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+        with open(pdf_path, "rb") as f:
+            output = f.read()
+        print(f"DEBUG: Incremental update of {len(output) - len(pdf_bytes)} bytes in {time.time() - start_time:.2f}s")
+        return output
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def _rotate_pages(doc, angle):
+    """Add angle to every page's /Rotate, the only change rotate_pdf makes."""
+    for page in doc:
+        # Get current rotation and add the new angle
+        page.set_rotation((page.rotation + angle) % 360)
+
+@cache_manager.cached_result()
+def rotate_pdf(pdf_bytes, angle=90, linearize=False, incremental=True):
     """
     Rotate PDF pages by a specific angle (90, 180, 270)
-    This is highly accurate as it only modifies PDF metadata for rotation
+    This is highly accurate as it only modifies PDF metadata for rotation,
+    so by default only the page objects are appended (see save_incremental);
+    a linearised result always needs the full rewrite.
     """
     if not pdf_bytes:
         raise ValueError("PDF file is empty")
         
     try:
-        pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
+        if incremental and not linearize:
+            output = save_incremental(pdf_bytes, lambda doc: _rotate_pages(doc, angle))
+            if output is not None:
+                return io.BytesIO(output)
         
-        for page_num in range(pdf_document.page_count):
-            page = pdf_document[page_num]
-            # Get current rotation and add the new angle
-            current_rotation = page.rotation
-            new_rotation = (current_rotation + angle) % 360
-            page.set_rotation(new_rotation)
+        pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
+        _rotate_pages(pdf_document, angle)
             
         # Save to memory with optimizations
         output_stream = io.BytesIO()
         pdf_document.save(output_stream, garbage=3, deflate=True)
         pdf_document.close()
         
+        if linearize:
+            return io.BytesIO(linearize_pdf(output_stream.getvalue()))
         output_stream.seek(0)
         return output_stream
         
     except Exception as e:
         raise Exception(f"Rotate PDF failed: {str(e)}")
 
-def get_pdf_page_images(pdf_bytes):
+# Document info keys edit_pdf_metadata can set, and the page label styles of PDF
+PDF_METADATA_KEYS = ('title', 'author', 'subject', 'keywords', 'creator', 'producer')
+PAGE_LABEL_STYLES = ('', 'D', 'r', 'R', 'a', 'A')
+
+def validate_page_labels(page_labels, page_count):
+    """
+    Check page label rules ({'startpage': 0-based page, 'prefix', 'style' one of
+    PAGE_LABEL_STYLES, 'firstpagenum'}) and return them normalised.
+    Raises ValueError for malformed rules.
     """
-    Extract thumbnail images of all PDF pages for preview
-    Returns list of base64-encoded JPEG images
+    if not isinstance(page_labels, list):
+        raise ValueError("page_labels must be a list of rules")
+    rules = []
+    for rule in page_labels:
+        if not isinstance(rule, dict):
+            raise ValueError("Each page label rule must be an object")
+        try:
+            startpage = int(rule.get('startpage', 0))
+            firstpagenum = int(rule.get('firstpagenum', 1))
+        except (TypeError, ValueError):
+            raise ValueError("startpage and firstpagenum must be whole numbers")
+        if not 0 <= startpage < page_count:
+            raise ValueError(f"startpage {startpage} is outside the document (0-{page_count - 1})")
+        if firstpagenum < 1:
+            raise ValueError("firstpagenum must be 1 or more")
+        style = rule.get('style', 'D')
+        if style not in PAGE_LABEL_STYLES:
+            raise ValueError(f"Unknown page label style '{style}' (use one of D, r, R, a, A or empty)")
+        rules.append({'startpage': startpage, 'prefix': str(rule.get('prefix', '')),
+                      'style': style, 'firstpagenum': firstpagenum})
+    return rules
+
+def _validate_metadata(metadata):
+    unknown = [key for key in metadata if key not in PDF_METADATA_KEYS]
+    if unknown:
+        raise ValueError(f"Unknown metadata fields: {', '.join(unknown)}")
+    not_text = [key for key, value in metadata.items() if not isinstance(value, str)]
+    if not_text:
+        raise ValueError(f"Metadata fields must be text: {', '.join(not_text)}")
+
+def _apply_metadata(doc, metadata, page_labels=None):
+    """Merge metadata into the document info and set already validated page labels."""
+    if metadata:
+        doc.set_metadata({**doc.metadata, **metadata})
+    if page_labels is not None:
+        doc.set_page_labels(page_labels)
+
+@cache_manager.cached_result()
+def edit_pdf_metadata(pdf_bytes, metadata=None, page_labels=None, incremental=True):
+    """
+    Set document info fields (PDF_METADATA_KEYS, the others are kept) and/or
+    replace the page labels (see validate_page_labels; [] removes them).
+    Like rotate_pdf, only the changed objects are appended unless incremental is off.
+    """
+    if not pdf_bytes:
+        raise ValueError("PDF file is empty")
+    metadata = metadata or {}
+    _validate_metadata(metadata)
+    
+    def apply_edits(pdf_document):
+        labels = page_labels
+        if labels is not None:
+            labels = validate_page_labels(labels, pdf_document.page_count)
+        _apply_metadata(pdf_document, metadata, labels)
+    
+    try:
+        if incremental:
+            output = save_incremental(pdf_bytes, apply_edits)
+            if output is not None:
+                return io.BytesIO(output)
+        
+        pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
+        apply_edits(pdf_document)
+        output_stream = io.BytesIO()
+        pdf_document.save(output_stream, garbage=3, deflate=True)
+        pdf_document.close()
+        
+        output_stream.seek(0)
+        return output_stream
+        
+    except ValueError:
+        # Bad page labels, reported to the user as-is
+        raise
+    except Exception as e:
+        raise Exception(f"Edit PDF metadata failed: {str(e)}")
+
+# Operations run_pdf_pipeline can chain; protect only changes how the result is
+# saved, so it has to be the last step
+PIPELINE_OPERATIONS = ('rotate', 'delete_pages', 'add_page_numbers', 'edit_metadata', 'protect')
+PIPELINE_MAX_STEPS = 20
+
+def validate_pipeline(operations):
+    """
+    Check a pipeline ([{'op': one of PIPELINE_OPERATIONS, ...options}]) before any
+    work is done. Page-dependent options are checked when their step runs.
+    Raises ValueError for malformed pipelines.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise ValueError("operations must be a non-empty list of steps")
+    if len(operations) > PIPELINE_MAX_STEPS:
+        raise ValueError(f"At most {PIPELINE_MAX_STEPS} steps per pipeline")
+    for number, step in enumerate(operations, 1):
+        if not isinstance(step, dict) or step.get('op') not in PIPELINE_OPERATIONS:
+            raise ValueError(f"Step {number}: op must be one of {', '.join(PIPELINE_OPERATIONS)}")
+        try:
+            _validate_pipeline_step(step, number == len(operations))
+        except ValueError as e:
+            raise ValueError(f"Step {number} ({step['op']}): {e}")
+
+def _is_whole_number(value):
+    # JSON true/false are ints to Python
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _validate_pipeline_step(step, is_last):
+    op = step['op']
+    if op == 'rotate':
+        angle = step.get('angle', 90)
+        if not _is_whole_number(angle) or angle % 90:
+            raise ValueError("angle must be a multiple of 90")
+    elif op == 'delete_pages':
+        pages = step.get('pages')
+        if not pages:
+            raise ValueError("no pages specified for deletion")
+        if not isinstance(pages, str) and not (isinstance(pages, list) and all(_is_whole_number(p) for p in pages)):
+            raise ValueError("pages must be a selection such as '1-3,7' or a list of page numbers")
+    elif op == 'add_page_numbers':
+        if step.get('position', 'bottom-center') not in PAGE_NUMBER_POSITIONS:
+            raise ValueError(f"position must be one of {', '.join(PAGE_NUMBER_POSITIONS)}")
+        if step.get('margin', 'recommended') not in PAGE_NUMBER_MARGINS:
+            raise ValueError(f"margin must be one of {', '.join(PAGE_NUMBER_MARGINS)}")
+        if not _is_whole_number(step.get('first_number', 1)):
+            raise ValueError("first_number must be a whole number")
+        if step.get('page_mode', 'single') not in ('single', 'facing'):
+            raise ValueError("page_mode must be single or facing")
+        if not isinstance(step.get('cover_page', False), bool):
+            raise ValueError("cover_page must be true or false")
+    elif op == 'edit_metadata':
+        if not isinstance(step.get('metadata', {}), dict):
+            raise ValueError("metadata must be an object")
+        _validate_metadata(step.get('metadata', {}))
+    elif op == 'protect':
+        if not isinstance(step.get('password'), str) or not step['password']:
+            raise ValueError("password is required for protection and must be text")
+        if not is_last:
+            raise ValueError("protect must be the last step")
+
+def run_pdf_pipeline(pdf_bytes, operations):
+    """
+    Apply page operations (see validate_pipeline) in order to one in-memory
+    document and save it once, instead of a parse and garbage-collected save per
+    endpoint. Steps use the same helpers as rotate_pdf, delete_pdf_pages,
+    add_page_numbers, edit_pdf_metadata and protect_pdf.
+    Returns (BytesIO, timings): [{'name', 'seconds'}] for open, every step and save.
+    Not result-cached, as the options may carry a password.
+    """
+    if not pdf_bytes:
+        raise ValueError("PDF file is empty")
+    validate_pipeline(operations)
+    
+    timings = []
+    step_start = time.time()
+    
+    def finish(name):
+        nonlocal step_start
+        now = time.time()
+        timings.append({'name': name, 'seconds': round(now - step_start, 4)})
+        step_start = now
+    
+    try:
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    except Exception as e:
+        raise Exception(f"PDF pipeline failed: {str(e)}")
+    try:
+        if doc.is_encrypted:
+            raise ValueError("PDF is password protected, unlock it first")
+        finish('open')
+        
+        save_options = {}
+        for number, step in enumerate(operations, 1):
+            op = step['op']
+            try:
+                if op == 'rotate':
+                    _rotate_pages(doc, step.get('angle', 90))
+                elif op == 'delete_pages':
+                    _delete_pages(doc, step['pages'])
+                elif op == 'add_page_numbers':
+                    _stamp_page_numbers(doc, step)
+                elif op == 'edit_metadata':
+                    page_labels = step.get('page_labels')
+                    if page_labels is not None:
+                        page_labels = validate_page_labels(page_labels, doc.page_count)
+                    _apply_metadata(doc, step.get('metadata', {}), page_labels)
+                elif op == 'protect':
+                    save_options = _encryption_options(step['password'])
+            except ValueError as e:
+                raise ValueError(f"Step {number} ({op}): {e}")
+            finish(op)
+        
+        output_stream = io.BytesIO()
+        doc.save(output_stream, garbage=3, deflate=True, **save_options)
+        finish('save')
+    except ValueError:
+        raise
+    except Exception as e:
+        raise Exception(f"PDF pipeline failed: {str(e)}")
+    finally:
+        doc.close()
+    
+    print(f"DEBUG: Pipeline of {len(operations)} steps in {sum(t['seconds'] for t in timings):.2f}s")
+    output_stream.seek(0)
+    return output_stream, timings
+
+THUMBNAIL_MIN_SIZE = 32
+THUMBNAIL_MAX_SIZE = 1600
+
+def _thumbnail_matrix(page, size=None):
+    """Zoom 1.0 (72 DPI) by default, or scale the page to size pixels wide."""
+    zoom = size / page.rect.width if size else 1.0
+    return fitz.Matrix(zoom, zoom)
+
+def _render_thumbnail(doc, doc_hash, page_number, size=None):
+    """JPEG thumbnail of one page (1-based), read from or written to the thumbnail cache."""
+    image_bytes = cache_manager.get_thumbnail(doc_hash, page_number, size)
+    if image_bytes is None:
+        page = doc[page_number - 1]
+        pix = page.get_pixmap(matrix=_thumbnail_matrix(page, size), colorspace=fitz.csRGB)
+        image_bytes = pix.tobytes("jpeg")
+        cache_manager.set_thumbnail(doc_hash, page_number, size, image_bytes)
+    return image_bytes
+
+def get_pdf_page_images(pdf_bytes, start=1, count=None, size=None, inline_count=None):
+    """
+    Extract thumbnail images of PDF pages for preview
+    start/count select a page range (1-based, default all pages) and size the
+    thumbnail width in pixels (default 72 DPI).
+    Returns (doc_id, page_count, pages). Only the first inline_count pages of the
+    range (default all) carry a base64 'image'; the rest only have
+    page_number/width/height and are fetched one by one through
+    get_page_thumbnail(doc_id, ...).
     """
     if not pdf_bytes:
         raise ValueError("PDF file is empty")
@@ -1071,42 +2343,186 @@ def get_pdf_page_images(pdf_bytes):
     try:
         import base64
         
+        doc_id = cache_manager.store_document(pdf_bytes)
         pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
+        page_count = pdf_document.page_count
+        first = max(start, 1)
+        last = page_count if count is None else min(first + count - 1, page_count)
         page_images = []
         
-        for page_num in range(pdf_document.page_count):
-            page = pdf_document[page_num]
-            
-            # Render page at lower resolution for thumbnails (150 DPI)
-            zoom = 1.0  # 72 DPI * 1.0 = 72 DPI for thumbnails
-            mat = fitz.Matrix(zoom, zoom)
-            pix = page.get_pixmap(matrix=mat, colorspace=fitz.csRGB)
-            
-            # Convert to JPEG bytes
-            img_bytes = pix.tobytes("jpeg")
-            
-            # Base64 encode for JSON transport
-            img_base64 = base64.b64encode(img_bytes).decode('utf-8')
-            
-            page_images.append({
-                'page_number': page_num + 1,
-                'image': f"data:image/jpeg;base64,{img_base64}",
-                'width': pix.width,
-                'height': pix.height
-            })
+        for page_number in range(first, last + 1):
+            page = pdf_document[page_number - 1]
+            rect = (page.rect * _thumbnail_matrix(page, size)).irect
+            entry = {
+                'page_number': page_number,
+                'width': rect.width,
+                'height': rect.height
+            }
+            if inline_count is None or len(page_images) < inline_count:
+                # Base64 encode for JSON transport
+                img_bytes = _render_thumbnail(pdf_document, doc_id, page_number, size)
+                img_base64 = base64.b64encode(img_bytes).decode('utf-8')
+                entry['image'] = f"data:image/jpeg;base64,{img_base64}"
+            page_images.append(entry)
         
         pdf_document.close()
         
-        print(f"DEBUG: Generated {len(page_images)} page thumbnails")
-        return page_images
+        print(f"DEBUG: Listed {len(page_images)} of {page_count} page thumbnails (inline: {inline_count if inline_count is not None else 'all'})")
+        return doc_id, page_count, page_images
         
     except Exception as e:
         raise Exception(f"Get PDF page images failed: {str(e)}")
 
+def get_page_thumbnail(doc_id, page_number, size=None):
+    """
+    JPEG bytes of one page thumbnail of a document stored by get_pdf_page_images.
+    Raises FileNotFoundError once the document has left the cache (upload it again)
+    and ValueError for a page outside the document.
+    """
+    image_bytes = cache_manager.get_thumbnail(doc_id, page_number, size) if cache_manager.is_content_hash(doc_id) else None
+    if image_bytes is not None:
+        return image_bytes
+    
+    pdf_path = cache_manager.get_document_path(doc_id)
+    if pdf_path is None:
+        raise FileNotFoundError("Document not found or expired, please upload it again")
+    
+    with fitz.open(pdf_path) as pdf_document:
+        if not 1 <= page_number <= pdf_document.page_count:
+            raise ValueError(f"Page {page_number} is out of range (1-{pdf_document.page_count})")
+        return _render_thumbnail(pdf_document, doc_id, page_number, size)
+
+# Sprite sheets: a grid of page thumbnails packed into one image, so one request
+# covers columns x rows pages of the page-picker grid
+SPRITE_COLUMNS = 5
+SPRITE_ROWS = 4
+SPRITE_DEFAULT_SIZE = 120
+SPRITE_FORMATS = ('jpg', 'webp')
+SPRITE_QUALITY = 80
+
+def _sprite_tile_layout(doc, tile, size, columns, rows):
+    """
+    Placement of the pages of one sprite tile: (sheet_width, sheet_height, cells)
+    with cells as (page_number, x, y, width, height). Every cell in a tile has the
+    size of its largest page so the grid stays regular.
+    """
+    per_tile = columns * rows
+    first = tile * per_tile + 1
+    last = min(first + per_tile - 1, doc.page_count)
+    rects = []
+    for page_number in range(first, last + 1):
+        page = doc[page_number - 1]
+        rects.append((page_number, (page.rect * _thumbnail_matrix(page, size)).irect))
+    cell_width = max(r.width for _, r in rects)
+    cell_height = max(r.height for _, r in rects)
+    cells = []
+    for i, (page_number, rect) in enumerate(rects):
+        x = (i % columns) * cell_width
+        y = (i // columns) * cell_height
+        cells.append((page_number, x, y, rect.width, rect.height))
+    used_rows = (len(rects) + columns - 1) // columns
+    return min(len(rects), columns) * cell_width, used_rows * cell_height, cells
+
+def _encode_sprite(sheet, fmt, quality=SPRITE_QUALITY):
+    if fmt == 'webp':
+        from PIL import Image
+        image = Image.frombytes("RGB", (sheet.width, sheet.height), sheet.samples)
+        out = io.BytesIO()
+        image.save(out, format="WEBP", quality=quality, method=4)
+        return out.getvalue()
+    return sheet.tobytes("jpeg", jpg_quality=quality)
+
+def _render_sprite_tile(doc, tile, size, columns, rows, fmt):
+    """Render the pages of one tile straight into a shared white pixmap and encode it."""
+    width, height, cells = _sprite_tile_layout(doc, tile, size, columns, rows)
+    sheet = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, width, height), False)
+    sheet.clear_with(255)
+    for page_number, x, y, _, _ in cells:
+        page = doc[page_number - 1]
+        pix = page.get_pixmap(matrix=_thumbnail_matrix(page, size), colorspace=fitz.csRGB, alpha=False)
+        pix.set_origin(x, y)
+        sheet.copy(pix, pix.irect)
+    return _encode_sprite(sheet, fmt)
+
+def get_thumbnail_sprite_index(pdf_bytes, size=SPRITE_DEFAULT_SIZE, columns=SPRITE_COLUMNS, rows=SPRITE_ROWS):
+    """
+    Page-to-tile index for sprite sheet thumbnails of a PDF.
+    Returns (doc_id, page_count, tile_count, pages) where each page has
+    page_number, tile, x, y, width and height inside its tile. Tiles themselves
+    are rendered on request by get_thumbnail_sprite(doc_id, tile, ...).
+    """
+    if not pdf_bytes:
+        raise ValueError("PDF file is empty")
+    
+    try:
+        doc_id = cache_manager.store_document(pdf_bytes)
+        pages = []
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as pdf_document:
+            page_count = pdf_document.page_count
+            per_tile = columns * rows
+            tile_count = (page_count + per_tile - 1) // per_tile
+            for tile in range(tile_count):
+                _, _, cells = _sprite_tile_layout(pdf_document, tile, size, columns, rows)
+                for page_number, x, y, width, height in cells:
+                    pages.append({
+                        'page_number': page_number,
+                        'tile': tile,
+                        'x': x,
+                        'y': y,
+                        'width': width,
+                        'height': height
+                    })
+        
+        print(f"DEBUG: Indexed {page_count} pages into {tile_count} sprite tiles ({columns}x{rows})")
+        return doc_id, page_count, tile_count, pages
+        
+    except Exception as e:
+        raise Exception(f"Get thumbnail sprite index failed: {str(e)}")
+
+def get_thumbnail_sprite(doc_id, tile, size=SPRITE_DEFAULT_SIZE, columns=SPRITE_COLUMNS, rows=SPRITE_ROWS, fmt='jpg'):
+    """
+    Encoded sprite sheet for one tile of a document stored by get_thumbnail_sprite_index.
+    Raises FileNotFoundError once the document has left the cache and ValueError
+    for a tile outside the document.
+    """
+    name = f"sprite{columns}x{rows}-{tile}"
+    image_bytes = cache_manager.get_thumbnail(doc_id, name, size, fmt) if cache_manager.is_content_hash(doc_id) else None
+    if image_bytes is not None:
+        return image_bytes
+    
+    pdf_path = cache_manager.get_document_path(doc_id)
+    if pdf_path is None:
+        raise FileNotFoundError("Document not found or expired, please upload it again")
+    
+    with fitz.open(pdf_path) as pdf_document:
+        tile_count = (pdf_document.page_count + columns * rows - 1) // (columns * rows)
+        if not 0 <= tile < tile_count:
+            raise ValueError(f"Tile {tile} is out of range (0-{tile_count - 1})")
+        image_bytes = _render_sprite_tile(pdf_document, tile, size, columns, rows, fmt)
+    cache_manager.set_thumbnail(doc_id, name, size, image_bytes, fmt)
+    return image_bytes
+
+def _delete_pages(doc, pages_to_delete):
+    """Remove a page selection from an open document, returns how many pages went."""
+    total_pages = doc.page_count
+    
+    # Validates page numbers (strict) and resolves odd/even/ranges
+    delete_set = set(parse_page_selection(pages_to_delete, total_pages, strict=True))
+    
+    # Check if trying to delete all pages
+    if len(delete_set) >= total_pages:
+        raise ValueError("Cannot delete all pages from PDF")
+    
+    # Keep everything else in a single select() instead of one delete per page
+    doc.select([p for p in range(total_pages) if p not in delete_set])
+    return len(delete_set)
+
+@cache_manager.cached_result()
 def delete_pdf_pages(pdf_bytes, pages_to_delete):
     """
     Delete specified pages from PDF
-    pages_to_delete: list of page numbers (1-indexed) to remove
+    pages_to_delete: list of page numbers (1-indexed) to remove, or a page
+                     selection string such as '1-3,7,even' (see parse_page_selection)
     Returns modified PDF as BytesIO stream
     """
     if not pdf_bytes:
@@ -1117,23 +2533,7 @@ def delete_pdf_pages(pdf_bytes, pages_to_delete):
     
     try:
         pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
-        total_pages = pdf_document.page_count
-        
-        # Convert to 0-indexed and sort in reverse order
-        pages_to_delete_0indexed = sorted([p - 1 for p in pages_to_delete], reverse=True)
-        
-        # Validate page numbers
-        for page_num in pages_to_delete_0indexed:
-            if page_num < 0 or page_num >= total_pages:
-                raise ValueError(f"Invalid page number: {page_num + 1}")
-        
-        # Check if trying to delete all pages
-        if len(pages_to_delete) >= total_pages:
-            raise ValueError("Cannot delete all pages from PDF")
-        
-        # Delete pages in reverse order to maintain correct indices
-        for page_num in pages_to_delete_0indexed:
-            pdf_document.delete_page(page_num)
+        deleted = _delete_pages(pdf_document, pages_to_delete)
         
         # Save to memory
         output_stream = io.BytesIO()
@@ -1142,107 +2542,546 @@ def delete_pdf_pages(pdf_bytes, pages_to_delete):
         
         output_stream.seek(0)
         
-        print(f"DEBUG: Deleted {len(pages_to_delete)} pages from PDF")
+        print(f"DEBUG: Deleted {deleted} pages from PDF")
         return output_stream
         
+    except ValueError:
+        # Bad page selection, reported to the user as-is
+        raise
     except Exception as e:
         raise Exception(f"Delete PDF pages failed: {str(e)}")
 
 
-def compress_pdf(pdf_bytes, level="recommended"):
+# Image recompression in compress_pdf: per level effective resolution (pixels per inch
+# at the image's largest placement) and JPEG quality
+COMPRESS_LEVELS = {
+    'extreme': {'dpi': 72, 'quality': 50},
+    'recommended': {'dpi': 150, 'quality': 75},
+    'less': {'dpi': 200, 'quality': 90},
+}
+COMPRESS_MIN_IMAGE_DIM = 600 # Smaller images are left alone unless drawn far below their size
+COMPRESS_RESAMPLE_MIN_SHRINK = 0.9 # Don't resample for less than a 10% reduction
+COMPRESS_WORKERS = int(os.environ.get("COMPRESS_WORKERS", os.cpu_count() or 1))
+COMPRESS_IMAGES_PER_BATCH = int(os.environ.get("COMPRESS_IMAGES_PER_BATCH", 8))
+
+def _collect_image_xrefs(doc):
+    """
+    Unique image xrefs of a document in first-use order:
+    {xref: {'pages': pages using it, 'first_page': n, 'width': w, 'height': h,
+            'display': (x, y)}}, display being the largest size in points the
+    image's own x and y axes are drawn at anywhere in the document (the page
+    size when a placement cannot be located). Stencil masks are left out,
+    they are 1-bit already.
+    """
+    import math
+
+    images = {}
+    for page in doc:
+        # Placements by pixel size. get_image_info(xrefs=True) / get_image_rects would name
+        # the xref but hash every decoded image to do it, so images of the same size on
+        # one page share their largest placement instead (never too small a target).
+        drawn = {}
+        for placed in page.get_image_info():
+            m = fitz.Matrix(placed['transform'])
+            drawn.setdefault((placed['width'], placed['height']), []).append((math.hypot(m.a, m.b), math.hypot(m.c, m.d)))
+        # get_images() reports the resolved /Width and /Height, which may be indirect objects
+        sizes = {img[0]: (img[2], img[3]) for img in page.get_images(full=True)}
+        for xref, (width, height) in sizes.items():
+            if xref in images:
+                images[xref]['pages'] += 1
+            elif doc.xref_get_key(xref, "ImageMask")[1] == "true" or width <= 0 or height <= 0:
+                continue
+            else:
+                images[xref] = {
+                    'pages': 1,
+                    'first_page': page.number,
+                    'width': width,
+                    'height': height,
+                    'display': (0.0, 0.0),
+                }
+            info = images[xref]
+            placements = drawn.get((info['width'], info['height'])) or [(page.rect.width, page.rect.height)]
+            for x, y in placements:
+                info['display'] = (max(info['display'][0], x), max(info['display'][1], y))
+    return images
+
+def _target_image_size(info, dpi):
+    """Pixel size that gives the image dpi at its largest placement, never larger than it is."""
+    display_x, display_y = info['display']
+    scale = max(display_x * dpi / 72.0 / max(info['width'], 1), display_y * dpi / 72.0 / max(info['height'], 1))
+    if scale >= COMPRESS_RESAMPLE_MIN_SHRINK:
+        return None
+    return max(1, round(info['width'] * scale)), max(1, round(info['height'] * scale))
+
+# Content-aware codec selection: thresholds of _classify_image on 8-bit samples
+COMPRESS_GRAY_MAX_CHROMA = 12       # 99th percentile of max-min over RGB still counted as gray
+COMPRESS_BILEVEL_MAX_MIDTONES = 0.05  # share of pixels between 64 and 192 for black-and-white...
+COMPRESS_BILEVEL_MIDTONES_PER_INK = 2  # ...and at most this many per dark pixel (antialiased edges)
+COMPRESS_PALETTE_MAX_COLORS = 256     # colours covering COMPRESS_PALETTE_COVERAGE of the pixels
+COMPRESS_PALETTE_COVERAGE = 0.995
+COMPRESS_CLASSIFY_SAMPLES = 256 * 1024  # pixels analysed per image (strided subsample)
+
+def _classify_image(pil_img):
+    """
+    Vectorised look at a decoded L/RGB image: 'bilevel' (black-and-white, e.g. a text
+    scan), 'gray' (colour image without chroma), 'palette' (flat colours, e.g. a
+    diagram) or 'color'. Works on a strided subsample so big scans stay cheap.
+    """
+    import numpy as np
+
+    samples = np.asarray(pil_img)
+    step = max(1, int((samples.shape[0] * samples.shape[1] / COMPRESS_CLASSIFY_SAMPLES) ** 0.5))
+    samples = samples[::step, ::step]
+
+    if samples.ndim == 3:
+        chroma = samples.max(axis=2).astype(np.int16) - samples.min(axis=2)
+        if np.percentile(chroma, 99) <= COMPRESS_GRAY_MAX_CHROMA:
+            samples = samples.mean(axis=2)
+        else:
+            packed = (samples[..., 0].astype(np.uint32) << 16) | (samples[..., 1].astype(np.uint32) << 8) | samples[..., 2]
+            counts = np.sort(np.unique(packed, return_counts=True)[1])[::-1]
+            covered = np.cumsum(counts[:COMPRESS_PALETTE_MAX_COLORS])[-1] / packed.size
+            return 'palette' if covered >= COMPRESS_PALETTE_COVERAGE else 'color'
+
+    midtones = np.count_nonzero((samples > 64) & (samples < 192))
+    ink = np.count_nonzero(samples <= 64)
+    if midtones <= COMPRESS_BILEVEL_MAX_MIDTONES * samples.size and midtones <= COMPRESS_BILEVEL_MIDTONES_PER_INK * ink:
+        return 'bilevel'
+    return 'gray'
+
+def _encode_g4(bilevel_img):
+    """CCITT G4 data of a mode '1' image: the single strip of a Group 4 TIFF written by Pillow."""
+    tiff_stream = io.BytesIO()
+    bilevel_img.save(tiff_stream, format="TIFF", compression="group4", tiffinfo={278: bilevel_img.height})
+    tiff = Image.open(io.BytesIO(tiff_stream.getvalue()))
+    offset, length = tiff.tag_v2[273][0], tiff.tag_v2[279][0]
+    return tiff_stream.getvalue()[offset:offset + length]
+
+def _encode_by_class(pil_img, image_class, quality):
+    """
+    Cheapest fitting encoding of a (resampled) image for its class, as
+    (data, colorspace, filter_name, bpc, decode_parms):
+    bilevel -> smaller of CCITT G4 and 1-bit Flate, gray -> gray JPEG,
+    palette -> smaller of indexed Flate and JPEG, color -> RGB JPEG.
+    """
+    import zlib
+
+    if image_class == 'bilevel':
+        bilevel = pil_img.convert("L").point(lambda v: 255 if v >= 128 else 0).convert("1")
+        g4 = _encode_g4(bilevel)
+        flate = zlib.compress(bilevel.tobytes(), 9)
+        if len(g4) < len(flate):
+            parms = f"<</K -1/Columns {bilevel.width}/Rows {bilevel.height}/BlackIs1 true>>"
+            return g4, "DeviceGray", "CCITTFaxDecode", 1, parms
+        return flate, "DeviceGray", "FlateDecode", 1, None
+
+    jpeg_stream = io.BytesIO()
+    jpeg_img = pil_img.convert("L") if image_class == 'gray' else pil_img
+    jpeg_img.save(jpeg_stream, format="JPEG", quality=quality, optimize=True)
+    jpeg = (jpeg_stream.getvalue(), "DeviceGray" if jpeg_img.mode == "L" else "DeviceRGB", "DCTDecode", 8, None)
+
+    if image_class == 'palette':
+        indexed = pil_img.quantize(colors=COMPRESS_PALETTE_MAX_COLORS, method=Image.Quantize.MEDIANCUT)
+        color_count = max(indexed.getdata()) + 1
+        palette = bytes(indexed.getpalette()[:color_count * 3])
+        flate = zlib.compress(indexed.tobytes(), 9)
+        if len(flate) < len(jpeg[0]):
+            return flate, f"[/Indexed/DeviceRGB {color_count - 1}<{palette.hex()}>]", "FlateDecode", 8, None
+    return jpeg
+
+def _recompress_image(doc, xref, settings, target_size=None, content_aware=True):
+    """
+    Decode one image xref, resample it to target_size (if given) and re-encode it
+    with the cheapest codec for its content (see _classify_image), or always as
+    JPEG at the level's quality when content_aware is off.
+    Returns (data, width, height, colorspace, encoding) where encoding holds the
+    image class, filter, bits per component and DecodeParms for _write_image_xref.
+    """
+    pix = fitz.Pixmap(doc, xref)
+    if pix.alpha:
+        pix = fitz.Pixmap(pix, 0)  # transparency lives in the SMask, which is kept
+    if pix.colorspace is None or pix.colorspace.n not in (1, 3):
+        pix = fitz.Pixmap(fitz.csRGB, pix)  # CMYK, Lab, ... to RGB
+    mode = "L" if pix.n == 1 else "RGB"
+    pil_img = Image.frombytes(mode, (pix.width, pix.height), pix.samples)
+    pix = None
+
+    # Classify before resampling: LANCZOS turns black-and-white edges into midtones
+    image_class = _classify_image(pil_img) if content_aware else ('gray' if mode == "L" else 'color')
+    if target_size:
+        pil_img = pil_img.resize(target_size, Image.Resampling.LANCZOS)
+
+    data, colorspace, filter_name, bpc, decode_parms = _encode_by_class(pil_img, image_class, settings['quality'])
+    encoding = {'class': image_class, 'filter': filter_name, 'bpc': bpc, 'decode_parms': decode_parms}
+    return data, pil_img.width, pil_img.height, colorspace, encoding
+
+def _recompress_images_worker(pdf_path, jobs, settings):
+    """Worker: recompress a batch of (xref, target_size), returns [(xref, result or None, seconds, error)]."""
+    results = []
+    with fitz.open(pdf_path) as doc:
+        for xref, target_size in jobs:
+            image_start = time.time()
+            try:
+                results.append((xref, _recompress_image(doc, xref, settings, target_size), time.time() - image_start, None))
+            except Exception as e:
+                results.append((xref, None, time.time() - image_start, str(e)))
+    return results
+
+def _write_image_xref(doc, xref, data, width, height, colorspace, filter_name="DCTDecode", bpc=8, decode_parms=None):
+    """Replace an image's stream and dictionary in place; its SMask and every page using it are kept."""
+    doc.update_stream(xref, data, compress=False)
+    doc.xref_set_key(xref, "Filter", f"/{filter_name}")
+    doc.xref_set_key(xref, "Width", str(width))
+    doc.xref_set_key(xref, "Height", str(height))
+    doc.xref_set_key(xref, "ColorSpace", colorspace if colorspace.startswith("[") else f"/{colorspace}")
+    doc.xref_set_key(xref, "BitsPerComponent", str(bpc))
+    if decode_parms:
+        doc.xref_set_key(xref, "DecodeParms", decode_parms)
+    for key in ("Decode",) if decode_parms else ("DecodeParms", "Decode"):
+        if doc.xref_get_key(xref, key)[0] != "null":
+            doc.xref_set_key(xref, key, "null")
+
+def _plan_recompression(images, settings):
+    """(xref, target_size) of the images worth recompressing at settings, target_size None to keep the size."""
+    candidates = []
+    for xref, info in images.items():
+        target_size = _target_image_size(info, settings['dpi'])
+        # Small images are only worth touching when they are drawn far smaller than they are
+        if info['width'] > COMPRESS_MIN_IMAGE_DIM or info['height'] > COMPRESS_MIN_IMAGE_DIM or (
+                target_size and target_size[0] * target_size[1] * 4 < info['width'] * info['height']):
+            candidates.append((xref, target_size))
+    return candidates
+
+def recompress_images(doc, pdf_bytes, settings, workers=None, images=None):
+    """
+    Recompress every large image of doc once per xref, however many pages share it,
+    resampled to the level's DPI at its largest placement in the document.
+    Images are decoded and re-encoded in a process pool when there are enough of
+    them, and a result is only written back if it is smaller than the original stream.
+    Returns stats: image/shared/recompressed counts, bytes saved and per-image timings.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    if workers is None:
+        workers = COMPRESS_WORKERS
+    start_time = time.time()
+    if images is None:
+        images = _collect_image_xrefs(doc)
+    candidates = _plan_recompression(images, settings)
+    batches = [candidates[i:i + COMPRESS_IMAGES_PER_BATCH] for i in range(0, len(candidates), COMPRESS_IMAGES_PER_BATCH)]
+
+    results = []
+    if workers <= 1 or len(batches) <= 1:
+        workers = 1
+        for xref, target_size in candidates:
+            image_start = time.time()
+            try:
+                results.append((xref, _recompress_image(doc, xref, settings, target_size), time.time() - image_start, None))
+            except Exception as e:
+                results.append((xref, None, time.time() - image_start, str(e)))
+    else:
+        workers = min(workers, len(batches))
+        temp_dir = tempfile.mkdtemp()
+        pdf_path = os.path.join(temp_dir, "input.pdf")
+        try:
+            with open(pdf_path, "wb") as f:
+                f.write(pdf_bytes)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_recompress_images_worker, pdf_path, batch, settings) for batch in batches]
+                for future in futures:
+                    results.extend(future.result())
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    stats = {
+        'images': len(images),
+        'shared_images': sum(1 for info in images.values() if info['pages'] > 1),
+        'recompressed': 0,
+        'bytes_saved': 0,
+        'classes': {},
+        'workers': workers,
+        'timings': [],
+    }
+    for xref, result, elapsed, error in results:
+        info = images[xref]
+        if error:
+            print(f"DEBUG: Image compression failed for xref {xref}: {error}")
+            continue
+        data, width, height, colorspace, encoding = result
+        original_size = len(doc.xref_stream_raw(xref))
+        saved = original_size - len(data)
+        if saved > 0:
+            _write_image_xref(doc, xref, data, width, height, colorspace,
+                              encoding['filter'], encoding['bpc'], encoding['decode_parms'])
+            stats['recompressed'] += 1
+            stats['bytes_saved'] += saved
+            image_class = stats['classes'].setdefault(encoding['class'], {'images': 0, 'bytes_saved': 0})
+            image_class['images'] += 1
+            image_class['bytes_saved'] += saved
+        stats['timings'].append({
+            'xref': xref, 'pages': info['pages'], 'size': (width, height), 'class': encoding['class'],
+            'filter': encoding['filter'], 'seconds': round(elapsed, 4), 'bytes_saved': max(saved, 0),
+        })
+        print(f"DEBUG: Image xref {xref} ({info['width']}x{info['height']} -> {width}x{height} {encoding['class']} "
+              f"{encoding['filter']}, used on {info['pages']} pages) took {elapsed:.3f}s, saved {max(saved, 0)} bytes")
+    print(f"DEBUG: Recompressed {stats['recompressed']}/{len(candidates)} images ({stats['shared_images']} shared) "
+          f"on {workers} cores in {time.time() - start_time:.2f}s, saved {stats['bytes_saved']} bytes")
+    return stats
+
+# Target-size mode: settings tried from lightest to heaviest, and how many of the
+# largest images are actually recompressed to predict the output size of a setting
+COMPRESS_TARGET_LADDER = [
+    {'dpi': 200, 'quality': 90},
+    {'dpi': 150, 'quality': 75},
+    {'dpi': 120, 'quality': 65},
+    {'dpi': 96, 'quality': 55},
+    {'dpi': 72, 'quality': 50},
+    {'dpi': 60, 'quality': 40},
+    {'dpi': 48, 'quality': 30},
+]
+COMPRESS_SAMPLE_IMAGES = int(os.environ.get("COMPRESS_SAMPLE_IMAGES", 4))
+
+class CompressionPredictor:
+    """
+    Predicts compress_pdf output sizes without writing a file: the document is
+    saved once without image changes to measure everything that is not an image,
+    then for each setting the COMPRESS_SAMPLE_IMAGES largest candidate images are
+    really recompressed and the rest are extrapolated from their bytes per pixel.
+    Sample results are shared between settings with the same target size and quality.
+    """
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.images = _collect_image_xrefs(doc)
+        self.raw_sizes = {xref: len(doc.xref_stream_raw(xref)) for xref in self.images}
+        # garbage=1 only drops unused objects; compacting would renumber the xrefs above
+        saved_size = len(doc.tobytes(garbage=1, deflate=True))
+        self.base_size = max(saved_size - sum(self.raw_sizes.values()), 0)
+        self._samples = {}
+
+    def _sample(self, xref, target_size, settings):
+        key = (xref, target_size, settings['quality'])
+        if key not in self._samples:
+            try:
+                data, width, height, _, _ = _recompress_image(self.doc, xref, settings, target_size)
+                self._samples[key] = (len(data), width * height)
+            except Exception as e:
+                print(f"DEBUG: Size prediction could not sample xref {xref}: {e}")
+                self._samples[key] = None
+        return self._samples[key]
+
+    def predict(self, settings):
+        """Predicted size in bytes of compress_pdf with these settings."""
+        candidates = _plan_recompression(self.images, settings)
+        sampled = sorted(candidates, key=lambda job: self.raw_sizes[job[0]], reverse=True)[:COMPRESS_SAMPLE_IMAGES]
+
+        planned = dict(candidates)
+        image_bytes = {xref: size for xref, size in self.raw_sizes.items() if xref not in planned}
+        sample_bytes = sample_pixels = 0
+        for xref, target_size in sampled:
+            sample = self._sample(xref, target_size, settings)
+            if sample is None:
+                image_bytes[xref] = self.raw_sizes[xref]
+                continue
+            image_bytes[xref] = min(sample[0], self.raw_sizes[xref])
+            sample_bytes += sample[0]
+            sample_pixels += sample[1]
+
+        bytes_per_pixel = sample_bytes / sample_pixels if sample_pixels else None
+        for xref, target_size in candidates:
+            if xref in image_bytes:
+                continue
+            info = self.images[xref]
+            pixels = target_size[0] * target_size[1] if target_size else info['width'] * info['height']
+            estimate = bytes_per_pixel * pixels if bytes_per_pixel is not None else self.raw_sizes[xref]
+            image_bytes[xref] = min(int(estimate), self.raw_sizes[xref])
+        return self.base_size + sum(image_bytes.values())
+
+    def choose(self, target_bytes, ladder=None):
+        """
+        Lightest setting of the ladder predicted to fit in target_bytes (binary search,
+        sizes shrink down the ladder). Returns (settings, predicted_size, target_met);
+        the heaviest setting when nothing fits.
+        """
+        ladder = ladder or COMPRESS_TARGET_LADDER
+        low, high = 0, len(ladder) - 1
+        best = None
+        predictions = {}
+        while low <= high:
+            middle = (low + high) // 2
+            predictions[middle] = self.predict(ladder[middle])
+            print(f"DEBUG: Predicted {predictions[middle]} bytes at {ladder[middle]}")
+            if predictions[middle] <= target_bytes:
+                best = middle
+                high = middle - 1
+            else:
+                low = middle + 1
+        if best is None:
+            heaviest = len(ladder) - 1
+            if heaviest not in predictions:
+                predictions[heaviest] = self.predict(ladder[heaviest])
+            return ladder[heaviest], predictions[heaviest], False
+        return ladder[best], predictions[best], True
+
+def estimate_compression(pdf_bytes, target_bytes=None):
     """
-    Compress PDF using PyMuPDF (fitz) with image downsampling and garbage collection.
-    Levels: 'extreme', 'recommended', 'less'
+    Dry run of compress_pdf: predicted output size for every level and, with
+    target_bytes, the setting target mode would pick. No file is produced.
+    """
+    if not pdf_bytes:
+        raise ValueError("PDF file is empty")
+    
+    try:
+        start_time = time.time()
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            predictor = CompressionPredictor(doc)
+            result = {
+                'original_size': len(pdf_bytes),
+                'levels': {
+                    level: dict(settings, predicted_size=min(predictor.predict(settings), len(pdf_bytes)))
+                    for level, settings in COMPRESS_LEVELS.items()
+                },
+            }
+            if target_bytes:
+                settings, predicted, met = predictor.choose(target_bytes)
+                result['target'] = dict(settings, target_bytes=target_bytes, predicted_size=predicted, target_met=met)
+        result['seconds'] = round(time.time() - start_time, 3)
+        print(f"DEBUG: Compression estimate took {result['seconds']}s")
+        return result
+    except Exception as e:
+        raise Exception(f"Compression estimate failed: {str(e)}")
+
+# Optional compress_pdf stages after image recompression, in the order they run
+COMPRESS_STAGES = ('strip', 'subset_fonts', 'object_streams')
+
+def _strip_extras(doc):
+    """Drop the document info, XMP metadata, page thumbnails and embedded files of doc."""
+    if any(doc.metadata.get(key) for key in ('title', 'author', 'subject', 'keywords', 'creator', 'producer')):
+        doc.set_metadata({})
+    if doc.xref_xml_metadata():
+        doc.del_xml_metadata()
+    for page in doc:
+        if doc.xref_get_key(page.xref, "Thumb")[0] != "null":
+            doc.xref_set_key(page.xref, "Thumb", "null")
+    for name in doc.embfile_names():
+        doc.embfile_del(name)
+
+def _run_compress_stages(doc, stages, stats, measure=False):
+    """
+    Apply the requested COMPRESS_STAGES to doc and save it once: strip (metadata,
+    thumbnails, embedded files), subset_fonts (glyphs actually used, needs fontTools)
+    and object_streams (objects packed into compressed object streams with an xref stream).
+    Each stage's time and the final save go to stats['stages']. With measure, doc is
+    also saved before and after every stage to report its bytes_saved (one full save
+    per stage). A failing stage may leave doc half-changed, so it raises instead of
+    saving on top of it. Returns the saved bytes.
+    """
+    save_options = {'garbage': 4, 'deflate': True, 'clean': True}
+    output_bytes = doc.tobytes(**save_options) if measure else None
+    for stage in COMPRESS_STAGES:
+        if stage not in stages:
+            continue
+        stage_start = time.time()
+        try:
+            if stage == 'strip':
+                _strip_extras(doc)
+            elif stage == 'subset_fonts':
+                doc.subset_fonts()
+            else:
+                save_options['use_objstms'] = 1
+            stage_bytes = doc.tobytes(**save_options) if measure else None
+        except Exception as e:
+            raise Exception(f"Compression stage {stage} failed: {str(e)}")
+        stats['stages'].append({'name': stage, 'seconds': round(time.time() - stage_start, 4)})
+        if measure:
+            stats['stages'][-1]['bytes_saved'] = len(output_bytes) - len(stage_bytes)
+            output_bytes = stage_bytes
+        print(f"DEBUG: Compression stage {stage} took {stats['stages'][-1]['seconds']}s")
+    if output_bytes is None:
+        save_start = time.time()
+        output_bytes = doc.tobytes(**save_options)
+        stats['stages'].append({'name': 'save', 'seconds': round(time.time() - save_start, 4)})
+    return output_bytes
+
+@cache_manager.cached_result(version="6")
+def compress_pdf_report(pdf_bytes, level="recommended", target_bytes=None, stages=(), linearize=False,
+                        measure_stages=False):
+    """
+    compress_pdf plus what it did: returns (BytesIO, stats) with the
+    recompress_images stats, per-stage timings and original/compressed sizes.
+    With target_bytes the level is ignored: the lightest setting predicted to fit
+    (see CompressionPredictor) is used for one full pass.
+    stages: optional COMPRESS_STAGES to run after the images; measure_stages adds
+    a save per stage to report its bytes saved (see _run_compress_stages).
+    linearize: write the result linearised (see linearize_pdf).
     """
     if not pdf_bytes:
         raise ValueError("PDF file is empty")
         
     try:
+        if target_bytes and len(pdf_bytes) <= target_bytes:
+            print(f"DEBUG: Already within target of {target_bytes} bytes. Returning original.")
+            size = len(pdf_bytes)
+            return io.BytesIO(linearize_pdf(pdf_bytes) if linearize else pdf_bytes), {
+                'images': 0, 'shared_images': 0, 'recompressed': 0, 'bytes_saved': 0, 'classes': {}, 'workers': 0,
+                'timings': [], 'stages': [], 'original_size': size, 'compressed_size': size, 'target_met': True,
+            }
+        
         doc = fitz.open(stream=pdf_bytes, filetype="pdf")
         
-        # Settings based on level
-        # Default: Recommended (150 DPI, 75 quality)
-        dpi = 150
-        quality = 75
-        
-        if level == "extreme":
-            dpi = 72
-            quality = 50
-        elif level == "less":
-            dpi = 200 # Higher DPI
-            quality = 90
-            
-        # Optimize images
-        for page in doc:
-            for img in page.get_images():
-                xref = img[0]
-                pix = fitz.Pixmap(doc, xref)
-                
-                # If image is larger than target DPI relative to page size? 
-                # Simplified: check pixel dimensions vs simple threshold or just blindly re-compress large images
-                if pix.width > 600 or pix.height > 600:
-                    try:
-                        # Create new pixmap with reduced size/quality if needed
-                        # Ideally we resample. PyMuPDF 'pix.shrink' or similar is option.
-                        # We'll use PIL for better control over efficient JPEG re-encoding
-                        
-                        # Existing logic was empty. Let's do a robust approach:
-                        # 1. Extract image bytes
-                        if pix.n - pix.alpha < 4:       # GRAY or RGB
-                            img_bytes = pix.tobytes("ppm")
-                        else:                           # PMAP: CMYK
-                            img_bytes = pix.tobytes("pam")
-                            
-                        # 2. Open in PIL
-                        from PIL import Image
-                        pil_img = Image.open(io.BytesIO(img_bytes))
-                        
-                        # 3. Resize if too big
-                        # Calculate target max dimension based on DPI (approx)
-                        # Let's say max dimension 1000px for extreme, 2000 for recommended
-                        max_dim = 2000
-                        if level == "extreme": max_dim = 1000
-                        elif level == "less": max_dim = 3000
-                        
-                        if pil_img.width > max_dim or pil_img.height > max_dim:
-                            pil_img.thumbnail((max_dim, max_dim), Image.Resampling.LANCZOS)
-                            
-                        # 4. Save to buffer as JPEG
-                        new_img_stream = io.BytesIO()
-                        pil_img.save(new_img_stream, format="JPEG", quality=quality, optimize=True)
-                        new_img_stream.seek(0)
-                        
-                        # 5. Update (replace) image in PDF
-                        doc.update_stream(xref, new_img_stream.read())
-                        
-                    except Exception as img_err:
-                        print(f"DEBUG: Image compression failed for xref {xref}: {img_err}")
-                        pass
+        image_start = time.time()
+        if target_bytes:
+            predictor = CompressionPredictor(doc)
+            settings, predicted, _ = predictor.choose(target_bytes)
+            stats = recompress_images(doc, pdf_bytes, settings, images=predictor.images)
+            stats['predicted_size'] = predicted
+        else:
+            # Settings based on level, default: Recommended (150 DPI, 75 quality)
+            settings = COMPRESS_LEVELS.get(level, COMPRESS_LEVELS['recommended'])
+            stats = recompress_images(doc, pdf_bytes, settings)
+        stats['settings'] = settings
+        stats['stages'] = [{
+            'name': 'images', 'seconds': round(time.time() - image_start, 4), 'bytes_saved': stats['bytes_saved'],
+        }]
 
-        output_stream = io.BytesIO()
         # garbage=4: dedup images, fonts, etc. deflate=True: compress streams
-        doc.save(output_stream, garbage=4, deflate=True, clean=True)
+        output_stream = io.BytesIO(_run_compress_stages(doc, stages, stats, measure_stages))
         doc.close()
         
-        output_stream.seek(0)
-        
         # Check if size actually reduced
         original_size = len(pdf_bytes)
         compressed_size = output_stream.getbuffer().nbytes
-        print(f"DEBUG: Compression ({level}). Original: {original_size}, New: {compressed_size}")
+        print(f"DEBUG: Compression ({level if not target_bytes else settings}). Original: {original_size}, New: {compressed_size}")
+        stats['original_size'] = original_size
+        stats['compressed_size'] = compressed_size
+        
+        if target_bytes:
+            stats['target_met'] = min(compressed_size, original_size) <= target_bytes
+            print(f"DEBUG: Target {target_bytes}, predicted {stats['predicted_size']}, got {compressed_size}")
         
-        if compressed_size >= original_size and level != "less":
+        if compressed_size >= original_size and (level != "less" or target_bytes):
              # If fitz didn't help, maybe it's already compressed. 
              # Return original to ensure no quality loss for no gain.
              print("DEBUG: Compressed size larger or equal. Returning original.")
-             return io.BytesIO(pdf_bytes)
+             stats['compressed_size'] = original_size
+             output_stream = io.BytesIO(pdf_bytes)
 
-        return output_stream
+        if linearize:
+            output_stream = io.BytesIO(linearize_pdf(output_stream.getvalue()))
+            stats['compressed_size'] = output_stream.getbuffer().nbytes
+        return output_stream, stats
         
     except Exception as e:
         raise Exception(f"Compress PDF failed: {str(e)}")
 
-def merge_pdf(pdf_bytes_list):
+def compress_pdf(pdf_bytes, level="recommended", stages=()):
+    """
+    Compress PDF using PyMuPDF (fitz) with image downsampling and garbage collection.
+    Levels: 'extreme', 'recommended', 'less'
+    """
+    return compress_pdf_report(pdf_bytes, level, stages=stages)[0]
+
+def merge_pdf(pdf_bytes_list, linearize=False):
     """
     Merge multiple PDF files into one using PyMuPDF (fitz) which is more robust
     """
@@ -1260,6 +3099,8 @@ def merge_pdf(pdf_bytes_list):
         merged_doc.save(output_stream, garbage=3, deflate=True)
         merged_doc.close()
             
+        if linearize:
+            return io.BytesIO(linearize_pdf(output_stream.getvalue()))
         output_stream.seek(0)
         return output_stream
         
@@ -1452,6 +3293,7 @@ def excel_to_pdf_fallback(excel_bytes):
         raise Exception(f"Fallback Excel to PDF conversion failed: {str(e)}")
 
 
+@cache_manager.cached_result()
 def excel_to_pdf(excel_bytes):
     """
     Convert Excel to PDF using platform-specific methods
@@ -1513,12 +3355,15 @@ def pdf_to_excel(pdf_bytes):
     
     try:
         import pdfplumber
+        profile = document_profile.get_document_profile(pdf_bytes)
         with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
             for i, page in enumerate(pdf.pages, 1):
                 tables = []
+                # Pages without a text layer have nothing for the extractors to find
+                has_text = profile.pages[i - 1]['text_length'] > 0 if i <= len(profile.pages) else True
                 
                 # 1. Try Tabula
-                if java_ok:
+                if java_ok and has_text:
                     try:
                         import tabula
                         dfs = tabula.read_pdf(io.BytesIO(pdf_bytes), pages=i, multiple_tables=True, silent=True)
@@ -1529,7 +3374,7 @@ def pdf_to_excel(pdf_bytes):
                 
                 # 2. Try pdfplumber
                 try:
-                    pqt = page.extract_tables()
+                    pqt = page.extract_tables() if has_text else None
                     if pqt:
                         for t in pqt:
                             if t:
@@ -1539,7 +3384,7 @@ def pdf_to_excel(pdf_bytes):
                 except: pass
                 
                 # 3. Advanced Text fallback (Word Clustering)
-                if not tables:
+                if not tables and has_text:
                     try:
                         words = page.extract_words()
                         if words:
@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import OrderedDict
+import fitz  # PyMuPDF
+import cache_manager
+
+# Profiles are small (a few numbers per page), so keep the most recent ones in memory
+PROFILE_CACHE_SIZE = 64
+
+_profile_cache = OrderedDict()
+_profile_lock = threading.Lock()
+
+class DocumentProfile:
+    """
+    Everything the converters need to know about a PDF before working on it,
+    collected in one pass over the fitz document:
+    encryption/repair state and, per page, size, text length, fonts, images
+    (count and page coverage) and vector drawing count.
+    """
+
+    def __init__(self, content_hash, page_count, is_encrypted, is_repaired, repair_reason, pages):
+        self.content_hash = content_hash
+        self.page_count = page_count
+        self.is_encrypted = is_encrypted
+        self.is_repaired = is_repaired
+        self.repair_reason = repair_reason
+        self.pages = pages
+
+    @property
+    def total_text_length(self):
+        return sum(p['text_length'] for p in self.pages)
+
+    @property
+    def image_count(self):
+        return sum(p['image_count'] for p in self.pages)
+
+    @property
+    def needs_ocr(self):
+        """
+        True only if it's truly a scanned document with no fonts and little text.
+        Same rules as the original needs_ocr: fonts on the first 5 pages mean a native
+        PDF; otherwise an image page with (almost) no text, or less than 20 characters
+        per page over the first 10 pages, means scanned.
+        """
+        if not self.pages:
+            return False
+        if any(p['has_fonts'] for p in self.pages[:5]):
+            return False
+        sample = self.pages[:10]
+        if any(p['text_length'] < 10 and p['image_count'] for p in sample):
+            return True
+        return sum(p['text_length'] for p in sample) < 20 * len(sample)
+
+    def is_image_only(self, page_index):
+        """Page with pictures but (almost) no extractable text, i.e. a scan that needs OCR."""
+        page = self.pages[page_index]
+        return page['text_length'] < 10 and page['image_count'] > 0
+
+    def page_complexity(self, page_index):
+        """
+        Cheap layout-complexity score used to route a page in pdf_to_word 'auto' mode.
+        Vector paths (table rules, charts) count 1 each, images 10 each, so a
+        few header rules stay on the fast path but any picture or table does not.
+        Pages with no extractable text (scans) always go to pdf2docx.
+        """
+        page = self.pages[page_index]
+        if page['text_length'] == 0:
+            return float("inf")
+        return page['drawing_count'] + 10 * page['image_count']
+
+def _profile_page(page):
+    """Single interpreter pass (bbox log) plus text and resource lookups for one page."""
+    rect = page.rect
+    page_area = max(rect.width * rect.height, 1.0)
+    image_area = 0.0
+    drawing_count = 0
+    for item_type, bbox in page.get_bboxlog():
+        if item_type == 'fill-image':
+            image_area += (fitz.Rect(bbox) & rect).get_area()
+        elif item_type in ('fill-path', 'stroke-path'):
+            drawing_count += 1
+
+    return {
+        'number': page.number,
+        'width': rect.width,
+        'height': rect.height,
+        'text_length': len(page.get_text("text").strip()),
+        'has_fonts': bool(page.get_fonts()),
+        'image_count': len(page.get_images()),
+        'image_coverage': min(image_area / page_area, 1.0),
+        'drawing_count': drawing_count,
+    }
+
+def build_profile(doc, content_hash=None):
+    """Walk an open fitz document once and return its DocumentProfile."""
+    start_time = time.time()
+    pages = []
+    repair_reason = "xref table repaired on open" if doc.is_repaired else None
+
+    if not doc.is_encrypted:
+        fitz.TOOLS.mupdf_warnings(reset=True)
+        for page in doc:
+            try:
+                for xref in page.get_contents():
+                    doc.xref_stream(xref)
+                pages.append(_profile_page(page))
+            except Exception as e:
+                repair_reason = repair_reason or f"broken content stream on page {page.number + 1}: {e}"
+                pages.append({
+                    'number': page.number, 'width': page.rect.width, 'height': page.rect.height,
+                    'text_length': 0, 'has_fonts': False, 'image_count': 0,
+                    'image_coverage': 0.0, 'drawing_count': 0,
+                })
+        warnings = fitz.TOOLS.mupdf_warnings(reset=True)
+        if warnings and not repair_reason:
+            repair_reason = f"content stream warnings: {warnings.splitlines()[0]}"
+
+    profile = DocumentProfile(
+        content_hash=content_hash,
+        page_count=doc.page_count,
+        is_encrypted=doc.is_encrypted,
+        is_repaired=doc.is_repaired,
+        repair_reason=repair_reason,
+        pages=pages,
+    )
+    print(f"DEBUG: Profiled {doc.page_count} pages in {time.time() - start_time:.2f}s")
+    return profile
+
+def get_document_profile(pdf_bytes, doc=None):
+    """
+    Return the DocumentProfile for pdf_bytes, cached by content hash.
+    Pass an already open fitz document to avoid opening the bytes again on a miss.
+    """
+    content_hash = cache_manager.get_hash(pdf_bytes)
+    with _profile_lock:
+        profile = _profile_cache.get(content_hash)
+        if profile is not None:
+            _profile_cache.move_to_end(content_hash)
+            return profile
+
+    if doc is not None:
+        profile = build_profile(doc, content_hash)
+    else:
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as opened:
+            profile = build_profile(opened, content_hash)
+
+    # Encrypted documents are profiled again once they are unlocked
+    if not profile.is_encrypted:
+        with _profile_lock:
+            _profile_cache[content_hash] = profile
+            while len(_profile_cache) > PROFILE_CACHE_SIZE:
+                _profile_cache.popitem(last=False)
+    return profile
+
+def get_file_profile(pdf_path):
+    """DocumentProfile for a PDF on disk."""
+    with open(pdf_path, "rb") as f:
+        return get_document_profile(f.read())
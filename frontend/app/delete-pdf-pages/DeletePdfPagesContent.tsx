@@ -9,7 +9,8 @@ import FAQ from "@/components/FAQ";
 
 interface PageData {
     page_number: number;
-    image: string;
+    image?: string;
+    thumbnail_url: string;
     width: number;
     height: number;
 }
@@ -92,6 +93,8 @@ export default function DeletePdfPagesContent() {
 
         const formData = new FormData();
         formData.append('file', selectedFile);
+        // First screenful comes back inline, the rest is loaded lazily as binary thumbnails
+        formData.append('inline', '12');
 
         try {
             const response = await fetch(`${baseUrl}/api/convert/get-pdf-pages`, {
@@ -245,8 +248,9 @@ export default function DeletePdfPagesContent() {
                             >
                                 <div className={styles.pageImageContainer} onClick={() => togglePageSelection(page.page_number)}>
                                     <img
-                                        src={page.image}
+                                        src={page.image || `${baseUrl}${page.thumbnail_url}`}
                                         alt={`Page ${page.page_number}`}
+                                        loading="lazy"
                                         className={styles.pageImage}
                                     />
                                     {selectedPages.has(page.page_number) && (
@@ -314,7 +318,7 @@ export default function DeletePdfPagesContent() {
                             <XCircle size={32} />
                         </button>
                         <div className={styles.modalImageContainer}>
-                            <img src={viewingPage.image} alt={`Page ${viewingPage.page_number}`} className={styles.modalImage} />
+                            <img src={viewingPage.image || `${baseUrl}${viewingPage.thumbnail_url}`} alt={`Page ${viewingPage.page_number}`} className={styles.modalImage} />
                         </div>
                         <div className={styles.modalFooter}>
                             <p>Page {viewingPage.page_number}</p>
@@ -24,5 +24,120 @@ def test_conversion():
     except Exception as e:
         print(f"Conversion failed with error: {e}")
 
+def test_page_selection_drops_ranges_outside_document():
+    from converter import parse_page_selection
+    assert parse_page_selection("10-12", 5) == []
+    assert parse_page_selection("10-", 5) == []
+    assert parse_page_selection("1-3,7,10-", 5) == [0, 1, 2]
+    # Partly inside: clamped to the document
+    assert parse_page_selection("3-10", 5) == [2, 3, 4]
+    assert parse_page_selection("10-3", 5) == [4, 3, 2]
+
+def test_plan_page_shards_covers_every_page_once():
+    from converter import plan_page_shards
+    assert plan_page_shards(0, 4) == []
+    # Too few pages to be worth a second process
+    assert plan_page_shards(10, 4, min_pages=8) == [(0, 10)]
+    assert plan_page_shards(17, 3, min_pages=8) == [(0, 9), (9, 17)]
+    shards = plan_page_shards(103, 4, min_pages=8)
+    assert len(shards) == 4
+    assert shards[0][0] == 0 and shards[-1][1] == 103
+    assert all(a[1] == b[0] for a, b in zip(shards, shards[1:]))
+
+def _docx_with_image(path, text, color):
+    from docx import Document
+    from PIL import Image
+    image = io.BytesIO()
+    Image.new("RGB", (40, 20), color).save(image, "PNG")
+    image.seek(0)
+    doc = Document()
+    doc.add_paragraph(text)
+    doc.add_picture(image)
+    doc.save(path)
+    return image.getvalue()
+
+def test_merge_docx_parts_relinks_images(tmp_path):
+    from docx import Document
+    from docx.oxml.ns import qn
+    from converter import merge_docx_parts
+    parts = [str(tmp_path / f"part{i}.docx") for i in range(2)]
+    blobs = [_docx_with_image(parts[0], "first", "red"), _docx_with_image(parts[1], "second", "blue")]
+    merged = merge_docx_parts(parts, str(tmp_path / "merged.docx"))
+
+    doc = Document(merged)
+    texts = [p.text for p in doc.paragraphs if p.text]
+    assert texts == ["first", "second"]
+    # Each picture points at a relationship of the merged part holding its own image
+    embeds = [node.get(qn("r:embed")) for node in doc.element.body.iter(qn("a:blip"))]
+    assert [doc.part.rels[rId].target_part.blob for rId in embeds] == blobs
+    # The first part's closing section became a section break inside the body
+    assert len(list(doc.element.body.iter(qn("w:sectPr")))) == 2
+
+def test_page_selection_negatives_reversals_and_strict():
+    import pytest
+    from converter import parse_page_selection
+    assert parse_page_selection("-1", 5) == [4]
+    assert parse_page_selection("-3--1", 5) == [2, 3, 4]
+    assert parse_page_selection("5-3", 5) == [4, 3, 2]
+    assert parse_page_selection("even,last", 5) == [1, 3, 4]
+    assert parse_page_selection([1, 3], 5) == [0, 2]
+    with pytest.raises(ValueError):
+        parse_page_selection("7", 5, strict=True)
+    with pytest.raises(ValueError):
+        parse_page_selection("0", 5)
+    with pytest.raises(ValueError):
+        parse_page_selection("5-x", 5)
+
+def test_plan_split_parts_bookmarks_follow_page_order():
+    import pytest
+    from converter import plan_split_parts
+    doc = fitz.open()
+    for _ in range(6):
+        doc.new_page()
+    doc.set_toc([[1, "Three", 5], [1, "One", 2], [1, "Same page", 2], [1, "Two", 3], [2, "Nested", 4]])
+    assert plan_split_parts(doc, "bookmarks") == [
+        ("00_front_matter.pdf", 0, 0), ("01_One.pdf", 1, 1), ("02_Two.pdf", 2, 3), ("03_Three.pdf", 4, 5),
+    ]
+    assert plan_split_parts(doc, "bookmarks", "2") == [("00_front_matter.pdf", 0, 2), ("01_Nested.pdf", 3, 5)]
+    with pytest.raises(ValueError):
+        plan_split_parts(doc, "bookmarks", "x")
+    with pytest.raises(ValueError):
+        plan_split_parts(doc, "bookmarks", "3")
+
+def test_ocr_cache_key_follows_page_content():
+    from converter import _ocr_cache_key, _single_page_pdf
+    doc = fitz.open()
+    for color in ((1, 0, 0), (0, 0, 1)):
+        page = doc.new_page()
+        page.draw_rect(page.rect, color=color, fill=color)
+    # Both pages share one resources dictionary, only their content streams differ
+    doc.xref_set_key(doc[1].xref, "Resources", doc.xref_get_key(doc[0].xref, "Resources")[1])
+    keys = [_ocr_cache_key(_single_page_pdf(doc, i)) for i in range(2)]
+    assert keys[0] != keys[1]
+    assert _ocr_cache_key(_single_page_pdf(doc, 0)) == keys[0]
+
+def test_validate_pipeline():
+    import pytest
+    from converter import validate_pipeline
+    validate_pipeline([
+        {"op": "rotate", "angle": 270},
+        {"op": "delete_pages", "pages": "2-3"},
+        {"op": "add_page_numbers", "position": "top-left", "first_number": 3, "cover_page": True},
+        {"op": "edit_metadata", "metadata": {"title": "Report"}},
+        {"op": "protect", "password": "secret"},
+    ])
+    for operations in (
+        [],
+        [{"op": "shred"}],
+        [{"op": "protect", "password": "secret"}, {"op": "rotate"}],
+        [{"op": "rotate", "angle": 45}],
+        [{"op": "edit_metadata", "metadata": {"title": 5}}],
+        [{"op": "protect", "password": 5}],
+        [{"op": "add_page_numbers", "first_number": None}],
+        [{"op": "add_page_numbers", "position": "nowhere"}],
+    ):
+        with pytest.raises(ValueError):
+            validate_pipeline(operations)
+
 if __name__ == "__main__":
     test_conversion()